@@ -0,0 +1,99 @@
+import csv
+import sys
+from cube import COUNT_METRICS, RESULT_KEYS
+from core import SELECTION_FIELDS
+
+# option labels contain commas, so several options in one cell are split on '|'
+VALUE_SEPARATOR = "|"
+CHUNK_SIZE = 4096
+
+
+def read_selections(path, fields=SELECTION_FIELDS, validate=None):
+    # validate (e.g. StatsEngine.validate) raises ValueError for a selection
+    # it rejects; the error names the file and line. A column that is not a
+    # field is an error too, as a misspelt one would leave its group unfiltered
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        unknown = [name for name in reader.fieldnames or [] if name.strip() not in fields]
+        if unknown:
+            raise ValueError("{0}: unknown column(s) {1}; expected {2}".format(
+                path, ", ".join(repr(name) for name in unknown), ", ".join(fields)
+            ))
+        for row in reader:
+            columns = {name.strip(): value for name, value in row.items() if name is not None}
+            selection = tuple(
+                tuple(v.strip() for v in (columns.get(field) or "").split(VALUE_SEPARATOR) if v.strip())
+                for field in fields
+            )
+            if validate is not None:
+                try:
+                    validate(selection)
+                except ValueError as e:
+                    raise ValueError("{0}, line {1}: {2}".format(path, reader.line_num, e))
+            yield selection
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def result_rows(engine, selections, chunk_size=CHUNK_SIZE):
+    counts = {m[0] for m in COUNT_METRICS}
+    for chunk in chunked(selections, chunk_size):
+        results = engine.compute_many(chunk)
+        columns = [
+            results[key].round().astype("int64").tolist() if key in counts else results[key].tolist()
+            for key in RESULT_KEYS
+        ]
+        for i, selection in enumerate(chunk):
+            yield [VALUE_SEPARATOR.join(values) for values in selection] + [column[i] for column in columns]
+
+
+def write_csv(rows, out, fields=SELECTION_FIELDS):
+    f = sys.stdout if out == "-" else open(out, "w", newline="")
+    try:
+        writer = csv.writer(f)
+        writer.writerow(list(fields) + RESULT_KEYS)
+        for row in rows:
+            writer.writerow(row)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def write_parquet(rows, out, chunk_size=CHUNK_SIZE, fields=SELECTION_FIELDS):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("writing Parquet output requires pyarrow")
+
+    names = list(fields) + RESULT_KEYS
+    writer = None
+    try:
+        for chunk in chunked(rows, chunk_size):
+            table = pa.Table.from_arrays([pa.array(column) for column in zip(*chunk)], names=names)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def run_batch(engine, source, out="-", chunk_size=CHUNK_SIZE):
+    # the whole file is read and checked before the output is opened, so a
+    # rejected file leaves no partial output behind
+    selections = engine.all_selections() if source == "all" else list(read_selections(source, engine.fields, engine.validate))
+    rows = result_rows(engine, selections, chunk_size)
+    if out.endswith(".parquet"):
+        write_parquet(rows, out, chunk_size, engine.fields)
+    else:
+        write_csv(rows, out, engine.fields)
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+from cube import DIMENSIONS, RESULT_KEYS, StatsCube
+from dataset import Dataset, narrow
+
+LEVELS = {
+    "psg_llc": [
+        "1. Gangrene", "2. Osteomyelitis, Foot", "3. Skin Ulcer, Foot", "4. Osteomyelitis, Lower Limb",
+        "5. Skin Ulcer, Lower Limb", "6. Cellulitis, Lower Limb", "7. Cellulitis, Toe"
+    ],
+    "psg_pad": ["PAD", "WO PAD"],
+    "psg_diabetes": ["Diabetes", "WO Diabetes", "WO Diabetes, Gangrene NEC"],
+    "hin_flag": ["Generic HIN", "Unique HIN"]
+}
+
+SOURCE_COLUMNS = [
+    'psg_llc', 'psg_pad', 'psg_diabetes', 'pad_or_diabetes', 'hin_flag',
+    'discharges_and_ds', 'discharges', 'days', 'deaths', 'hig_wc', 'unique_patients_ip_ds',
+    'major_during', 'minor_during', 'lpr_during', 'major_1yr', 'minor_1yr', 'lpr_1yr',
+    'major_3yr', 'minor_3yr', 'lpr_3yr', 'major_5yr', 'minor_5yr', 'lpr_5yr',
+    'ed_v', 'unique_patients_ed',
+    'major_amp_1yr', 'minor_amp_1yr', 'lower_pr_1yr', 'major_amp_3yr', 'minor_amp_3yr', 'lower_pr_3yr',
+    'major_amp_5yr', 'minor_amp_5yr', 'lower_pr_5yr'
+]
+
+DEFAULT_ROWS = [1000, 10000, 100000, 1000000]
+
+
+def make_srcdata(rows, seed=0):
+    # synthetic srcdata rows with the workbook's schema and plausible counters
+    rng = np.random.default_rng(seed)
+    codes = {column: rng.integers(0, len(levels), rows).astype(np.int8) for column, levels in LEVELS.items()}
+
+    dd = rng.poisson(2.0, rows) + 1
+    discharges = rng.binomial(dd, 0.9)
+    ed_v = rng.poisson(1.5, rows)
+    values = {
+        'pad_or_diabetes': ((codes['psg_pad'] == 0) | (codes['psg_diabetes'] == 0)).astype(np.int64),
+        'discharges_and_ds': dd,
+        'discharges': discharges,
+        'days': discharges * rng.poisson(15, rows),
+        'deaths': rng.binomial(discharges, 0.05),
+        'hig_wc': rng.gamma(2.0, 2.0, rows),
+        'unique_patients_ip_ds': np.ones(rows, dtype=np.int64),
+        'ed_v': ed_v,
+        'unique_patients_ed': (ed_v > 0).astype(np.int64)
+    }
+    for prefix, p in (('major', 0.10), ('minor', 0.12), ('lpr', 0.07)):
+        for period, scale in (('during', 1.0), ('1yr', 1.6), ('3yr', 1.8), ('5yr', 1.9)):
+            values['{0}_{1}'.format(prefix, period)] = rng.binomial(dd, p * scale)
+    for prefix, p in (('major_amp', 0.08), ('minor_amp', 0.09), ('lower_pr', 0.05)):
+        for period, scale in (('1yr', 1.0), ('3yr', 1.4), ('5yr', 1.6)):
+            values['{0}_{1}'.format(prefix, period)] = rng.binomial(ed_v, p * scale)
+
+    return Dataset(
+        SOURCE_COLUMNS,
+        codes,
+        {column: list(levels) for column, levels in LEVELS.items()},
+        {column: narrow(v) for column, v in values.items()}
+    )
+
+
+def to_frame(dataset):
+    import pandas as pd
+
+    return pd.DataFrame({column: dataset[column] for column in dataset.columns})
+
+
+def random_selections(count, seed=1):
+    rng = np.random.default_rng(seed)
+    selections = []
+    for _ in range(count):
+        selection = []
+        for column in DIMENSIONS:
+            levels = LEVELS[column]
+            selection.append([level for level in levels if rng.random() < 0.4])
+        selections.append(selection)
+
+    return selections
+
+
+def summarise(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "n": int(len(samples)),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "min_ms": float(samples.min())
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def legacy_filter_and_agg(dataImport, llc, pad, diabetes, resultsStats=None):
+    # the pre-cube ClassificationTool.dfFilterAndAgg (baseline commit), copied
+    # as it was apart from self.: the option lists are passed in, and
+    # resultsStats (kept between calls, as on the tool) is returned instead
+    # of updating the info card
+    if resultsStats is None:
+        resultsStats = dict.fromkeys(RESULT_KEYS, 0)
+
+    df = dataImport.copy()
+
+    if len(llc) > 0:
+        df = df.loc[df["psg_llc"].isin(llc)]
+    if len(pad) > 0:
+        df = df.loc[df["psg_pad"].isin(pad)]
+    if len(diabetes) > 0:
+        df = df.loc[df["psg_diabetes"].isin(diabetes)]
+    if len(llc) == 0 and len(pad) == 0 and len(diabetes) == 0:
+        df = df.loc[df["psg_llc"].isin(llc) & df["psg_pad"].isin(pad) & df["psg_diabetes"].isin(diabetes)]
+
+    if df.shape[0] == 0:
+        resultsStats = dict.fromkeys(resultsStats, 0)
+    else:
+        resultsStats['discharges_and_ds'] = df['discharges_and_ds'].sum()
+        resultsStats['alos'] = df['days'].sum()/df['discharges'].sum()
+        resultsStats['ed_v'] = df['ed_v'].sum()
+        resultsStats['discharges_and_ds_per_pat'] = df['discharges_and_ds'].sum()/df['unique_patients_ip_ds'].sum()
+        resultsStats['ed_visits_per_pat'] = df['ed_v'].sum()/df['unique_patients_ed'].sum()
+
+        if df.loc[df['hin_flag'] == 'Unique HIN'].shape[0] == 0:
+            resultsStats['unique_patients_ip_ds'] = 0
+            resultsStats['unique_patients_ed'] = 0
+        else:
+            resultsStats['unique_patients_ip_ds'] = df.loc[df['hin_flag'] == 'Unique HIN', 'unique_patients_ip_ds'].sum()
+            resultsStats['unique_patients_ed'] = df.loc[df['hin_flag'] == 'Unique HIN', 'unique_patients_ed'].sum()
+
+        if df['discharges_and_ds'].sum() > 0:
+            resultsStats['major_during'] = df['major_during'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['minor_during'] = df['minor_during'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['lpr_during'] = df['lpr_during'].sum()/df['discharges_and_ds'].sum()
+
+        if df['discharges_and_ds'].sum() > 0:
+            resultsStats['major_1yr'] = df['major_1yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['minor_1yr'] = df['minor_1yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['lpr_1yr'] = df['lpr_1yr'].sum()/df['discharges_and_ds'].sum()
+
+        if df['discharges_and_ds'].sum() > 0:
+            resultsStats['major_3yr'] = df['major_3yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['minor_3yr'] = df['minor_3yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['lpr_3yr'] = df['lpr_3yr'].sum()/df['discharges_and_ds'].sum()
+
+        if df['discharges_and_ds'].sum() > 0:
+            resultsStats['major_5yr'] = df['major_5yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['minor_5yr'] = df['minor_5yr'].sum()/df['discharges_and_ds'].sum()
+            resultsStats['lpr_5yr'] = df['lpr_5yr'].sum()/df['discharges_and_ds'].sum()
+
+        if df['ed_v'].sum() > 0:
+            resultsStats['major_amp_1yr'] = df['major_amp_1yr'].sum()/df['ed_v'].sum()
+            resultsStats['minor_amp_1yr'] = df['minor_amp_1yr'].sum()/df['ed_v'].sum()
+            resultsStats['lower_pr_1yr'] = df['lower_pr_1yr'].sum()/df['ed_v'].sum()
+
+        if df['ed_v'].sum()  > 0:
+            resultsStats['major_amp_3yr'] = df['major_amp_3yr'].sum()/df['ed_v'].sum()
+            resultsStats['minor_amp_3yr'] = df['minor_amp_3yr'].sum()/df['ed_v'].sum()
+            resultsStats['lower_pr_3yr'] = df['lower_pr_3yr'].sum()/df['ed_v'].sum()
+
+        if df['ed_v'].sum() > 0:
+            resultsStats['major_amp_5yr'] = df['major_amp_5yr'].sum()/df['ed_v'].sum()
+            resultsStats['minor_amp_5yr'] = df['minor_amp_5yr'].sum()/df['ed_v'].sum()
+            resultsStats['lower_pr_5yr'] = df['lower_pr_5yr'].sum()/df['ed_v'].sum()
+
+    return resultsStats
+
+
+def bench_load(dataset, workdir, excel_max):
+    from snapshot import load_snapshot, read_source, write_snapshot
+
+    results = {}
+    path = os.path.join(workdir, "srcdata_{0}.xlsx".format(len(dataset)))
+    if len(dataset) <= excel_max:
+        to_frame(dataset).to_excel(path, sheet_name="srcdata", index=False)
+        results["excel_s"], _ = timed(lambda: Dataset.from_frame(read_source(path)))
+    else:
+        # the snapshot only needs a file to fingerprint
+        open(path, "wb").close()
+
+    results["snapshot_write_s"], _ = timed(write_snapshot, dataset, path)
+    results["snapshot_load_s"], loaded = timed(load_snapshot, path)
+    results["snapshot_bytes"] = int(loaded.nbytes)
+
+    return results
+
+
+def bench_aggregate(dataset, toggles, legacy_max):
+    from bitmap import BitmapIndex
+
+    results = {}
+    selections = random_selections(toggles)
+
+    results["cube_build_s"], cube = timed(StatsCube, dataset)
+    results["cube_toggle"] = summarise([timed(cube.stats, *s)[0] for s in selections])
+    results["cube_all_selections_s"], _ = timed(cube.stats_many, cube.all_selections())
+
+    results["bitmap_build_s"], index = timed(BitmapIndex, dataset)
+    filters = [dict(zip(DIMENSIONS, s)) for s in selections]
+    results["bitmap_toggle"] = summarise([timed(index.stats, f)[0] for f in filters])
+
+    if len(dataset) <= legacy_max:
+        df = to_frame(dataset)
+        resultsStats = dict.fromkeys(RESULT_KEYS, 0)
+        results["legacy_toggle"] = summarise([timed(legacy_filter_and_agg, df, *s, resultsStats)[0] for s in selections])
+
+    return results
+
+
+def bench_render(toggles):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from charts import ProbabilityChart
+    from core import empty_stats
+
+    rng = np.random.default_rng(2)
+    frames = []
+    for _ in range(toggles):
+        stats = empty_stats()
+        stats.update({key: float(rng.random()) for key in stats})
+        frames.append(stats)
+
+    results = {}
+    canvas = FigureCanvasAgg(Figure(figsize=(5, 7), dpi=200, tight_layout=True))
+    full = ProbabilityChart(canvas.figure)
+    canvas.draw()
+    results["full_draw"] = summarise([timed(lambda s: (full.update(s), canvas.draw()), s)[0] for s in frames])
+
+    canvas = FigureCanvasAgg(Figure(figsize=(5, 7), dpi=200, tight_layout=True))
+    blit = ProbabilityChart(canvas.figure, animated=True)
+    canvas.draw()
+    results["blit_update"] = summarise([timed(lambda s: (blit.update(s), blit.redraw()), s)[0] for s in frames])
+
+    return results
+
+
+def run(rows, toggles=50, excel_max=10000, legacy_max=1000000, render=True):
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "sizes": []
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in rows:
+            build_s, dataset = timed(make_srcdata, n)
+            entry = {"rows": n, "generate_s": build_s}
+            entry["load"] = bench_load(dataset, workdir, excel_max)
+            entry["aggregate"] = bench_aggregate(dataset, toggles, legacy_max)
+            report["sizes"].append(entry)
+            print("{0:>10} rows  cube toggle p50 {1:.3f} ms  bitmap toggle p50 {2:.3f} ms".format(
+                n, entry["aggregate"]["cube_toggle"]["p50_ms"], entry["aggregate"]["bitmap_toggle"]["p50_ms"]
+            ), file=sys.stderr)
+
+    if render:
+        report["render"] = bench_render(toggles)
+
+    return report
+
+
+def flatten(report, prefix=""):
+    flat = {}
+    for key, value in report.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+
+    return flat
+
+
+def compare(baseline, current):
+    # timing ratios current/baseline for every measurement both runs share
+    def keyed(report):
+        flat = flatten({str(size["rows"]): size for size in report["sizes"]})
+        flat.update(flatten(report.get("render", {}), "render."))
+        return {k: v for k, v in flat.items() if k.endswith("_s") or k.endswith("_ms")}
+
+    old, new = keyed(baseline), keyed(current)
+    return {key: new[key] / old[key] for key in sorted(old) if key in new and old[key] > 0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark load, aggregation and chart rendering on synthetic srcdata")
+    parser.add_argument("--rows", nargs="+", type=float, default=DEFAULT_ROWS, help="table sizes to generate (e.g. 1e3 1e7)")
+    parser.add_argument("--toggles", type=int, default=50, help="selections timed per size")
+    parser.add_argument("--excel-max", type=float, default=10000, help="largest size also round-tripped through an .xlsx")
+    parser.add_argument("--legacy-max", type=float, default=1000000, help="largest size also timed with the old pandas filter")
+    parser.add_argument("--no-render", action="store_true", help="skip the chart rendering benchmark")
+    parser.add_argument("--out", default="-", help="JSON report path (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="print current/baseline timing ratios against an earlier report")
+    args = parser.parse_args()
+
+    report = run([int(n) for n in args.rows], args.toggles, args.excel_max, args.legacy_max, not args.no_render)
+    if args.compare:
+        with open(args.compare) as f:
+            report["compare"] = compare(json.load(f), report)
+
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text)
@@ -0,0 +1,80 @@
+import numpy as np
+from cube import HIN_COLUMN, UNIQUE_HIN, SUM_COLUMNS, results_from_sums, stats_dict
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class BitmapIndex:
+    # one packed bitset per distinct value of each indexed column; a selection is
+    # OR within a column and AND across columns, evaluated on the packed bytes
+
+    def __init__(self, dataset, columns=None):
+        if columns is None:
+            columns = [c for c in dataset.columns if dataset.is_categorical(c)]
+        elif HIN_COLUMN not in columns:
+            columns = list(columns) + [HIN_COLUMN]
+
+        self.dataset = dataset
+        self.rows = len(dataset)
+        self.everything = np.packbits(np.ones(self.rows, dtype=bool))
+        self.bitmaps = {}
+        for column in columns:
+            self.add_column(column)
+
+    def add_column(self, column):
+        if self.dataset.is_categorical(column):
+            levels, codes = self.dataset.factorize(column)
+        else:
+            levels, codes = np.unique(np.asarray(self.dataset[column]), return_inverse=True)
+            codes = codes.ravel()
+        self.bitmaps[column] = {
+            str(level): np.packbits(codes == k) for k, level in enumerate(levels.tolist())
+        }
+
+    def __contains__(self, column):
+        return column in self.bitmaps
+
+    def select(self, filters):
+        # filters: column -> selected values; a column without values is not filtered
+        selected = self.everything.copy()
+        for column, values in filters.items():
+            if not values:
+                continue
+            if column not in self.bitmaps:
+                self.add_column(column)
+            bitmaps = self.bitmaps[column]
+            matched = np.zeros_like(selected)
+            for value in values:
+                if str(value) in bitmaps:
+                    matched |= bitmaps[str(value)]
+            selected &= matched
+
+        return selected
+
+    def count(self, packed):
+        return int(POPCOUNT[packed].sum(dtype=np.int64))
+
+    def mask(self, packed):
+        return np.unpackbits(packed, count=self.rows).view(bool)
+
+    def row_ids(self, packed):
+        return np.flatnonzero(self.mask(packed))
+
+    def sums(self, packed, columns):
+        return self.dataset.sums(columns, self.row_ids(packed))
+
+    def stats(self, filters):
+        # same rules as the checkbox groups: nothing selected anywhere selects nothing
+        if not any(filters.values()):
+            return stats_dict(results_from_sums(np.zeros(len(SUM_COLUMNS)), np.zeros(len(SUM_COLUMNS)), 0))
+
+        packed = self.select(filters)
+        unique = packed & self.bitmaps[HIN_COLUMN].get(UNIQUE_HIN, np.zeros_like(packed))
+        totals = self.sums(packed, SUM_COLUMNS)
+        unique_totals = self.sums(unique, SUM_COLUMNS)
+
+        return stats_dict(results_from_sums(
+            [totals[c] for c in SUM_COLUMNS],
+            [unique_totals[c] for c in SUM_COLUMNS],
+            self.count(packed)
+        ))
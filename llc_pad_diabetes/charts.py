@@ -0,0 +1,152 @@
+import matplotlib
+import matplotlib.ticker as mticker
+import numpy as np
+
+FONT = {
+    'weight': 'normal',
+    'size': 4.5
+}
+
+BAR_COLORS = {
+    'during': '#8dd3c7',
+    '1yripds': '#3182bd', '1yred': '#b22222',
+    '3yripds': '#9ecae1', '3yred': '#feb24c',
+    '5yripds': '#deebf7', '5yred': '#ffeda0'
+}
+
+BAR_LABELS = ['Major\nAmputation', 'Minor\nAmputation', 'Lower\nPeripheral\nRevascularization']
+
+# compared cohorts share the series colours and are told apart by hatching;
+# the first cohort (the live selection) is drawn exactly as on its own
+COHORT_HATCHES = [None, '//////', '......', 'xxxxxx', '\\\\\\', 'oooo']
+MAX_COHORTS = len(COHORT_HATCHES)
+
+# (title, [(legend label, resultsStats keys, colour key)])
+PANELS = [
+    ('Probability of Procedure During Discharge', [
+        (None, ['major_during', 'minor_during', 'lpr_during'], 'during')
+    ]),
+    ('Probability of Procedure Within 1YR', [
+        ('IP & Day Surgery', ['major_1yr', 'minor_1yr', 'lpr_1yr'], '1yripds'),
+        ('ED', ['major_amp_1yr', 'minor_amp_1yr', 'lower_pr_1yr'], '1yred')
+    ]),
+    ('Probability of Procedure Within 3YRS', [
+        ('IP & Day Surgery', ['major_3yr', 'minor_3yr', 'lpr_3yr'], '3yripds'),
+        ('ED', ['major_amp_3yr', 'minor_amp_3yr', 'lower_pr_3yr'], '3yred')
+    ]),
+    ('Probability of Procedure Within 5YRS', [
+        ('IP & Day Surgery', ['major_5yr', 'minor_5yr', 'lpr_5yr'], '5yripds'),
+        ('ED', ['major_amp_5yr', 'minor_amp_5yr', 'lower_pr_5yr'], '5yred')
+    ])
+]
+
+
+class ProbabilityChart:
+    # the 2x2 probability panels; artists are created once and only their
+    # heights and label text change afterwards. With animated=True the bars and
+    # labels are left out of full draws and blitted over a cached background.
+    # With several cohorts each series gets one bar per cohort, side by side;
+    # only the live cohort (0) is animated, the pinned ones are part of the
+    # cached background and a change to them takes one full draw.
+
+    def __init__(self, figure, animated=False, cohorts=1, cohort_labels=None):
+        matplotlib.rc('font', **FONT)
+
+        self.figure = figure
+        self.animated = animated
+        self.cohorts = cohorts
+        self.background = None
+        self.stale = False
+        self.draw_cid = None
+        self.ax = figure.subplots(nrows=2, ncols=2)
+        self.series = []
+
+        x = np.arange(len(BAR_LABELS))
+        for axis, (title, series) in zip(self.ax.flat, PANELS):
+            axis.set_title(title)
+            axis.set_ylabel("Probability of Procedure")
+            axis.set_ylim([0, 1])
+            ticks_loc = axis.get_yticks().tolist()
+            axis.yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
+            axis.set_yticklabels(['{:,.0%}'.format(t) for t in ticks_loc])
+            axis.set_xticks(x)
+            axis.set_xticklabels(BAR_LABELS)
+
+            n = cohorts * len(series)
+            width = 0.8 if n == 1 else 0.7 / n
+            for cohort in range(cohorts):
+                for i, (label, keys, color) in enumerate(series):
+                    offset = (cohort * len(series) + i - (n - 1) / 2) * width
+                    bars = axis.bar(
+                        x + offset, [0] * len(keys), width=width, color=BAR_COLORS[color],
+                        label=label if cohort == 0 else '_nolegend_', animated=animated and cohort == 0,
+                        hatch=COHORT_HATCHES[cohort], edgecolor='#555555' if cohort else None, linewidth=0
+                    )
+                    texts = axis.bar_label(container=bars, labels=['0%'] * len(keys), padding=3)
+                    for text in texts:
+                        text.set_animated(animated and cohort == 0)
+                    self.series.append((cohort, keys, bars, texts))
+            if len(series) > 1:
+                axis.legend(loc='upper right')
+
+        if cohorts > 1:
+            # the single-series panel has room for the cohort key
+            from matplotlib.patches import Patch
+            labels = cohort_labels or [str(c + 1) for c in range(cohorts)]
+            handles = [
+                Patch(facecolor='white', edgecolor='#555555', hatch=COHORT_HATCHES[c], label=labels[c])
+                for c in range(cohorts)
+            ]
+            self.ax.flat[0].legend(handles=handles, loc='upper right')
+
+        if animated:
+            self.draw_cid = figure.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def remove(self):
+        # before the figure is cleared for a new chart
+        if self.draw_cid is not None:
+            self.figure.canvas.mpl_disconnect(self.draw_cid)
+            self.draw_cid = None
+
+    def artists(self):
+        # the animated (live cohort) artists
+        for cohort, keys, bars, texts in self.series:
+            if cohort == 0:
+                yield from bars
+                yield from texts
+
+    def on_draw(self, event):
+        # a full draw: the pinned cohorts are up to date in the new background
+        self.stale = False
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.artists():
+            self.figure.draw_artist(artist)
+
+    def update(self, stats, cohort=0):
+        # only the artists of the given cohort are touched
+        changed = []
+        for c, keys, bars, texts in self.series:
+            if c != cohort:
+                continue
+            for key, rect, text in zip(keys, bars, texts):
+                value = stats[key]
+                if rect.get_height() != value:
+                    rect.set_height(value)
+                    text.xy = (rect.get_x() + rect.get_width() / 2, value)
+                    text.set_text('{:.0%}'.format(value))
+                    changed.append(rect)
+        if changed and cohort:
+            self.stale = True
+
+        return changed
+
+    def redraw(self):
+        canvas = self.figure.canvas
+        if not self.animated or self.background is None or self.stale:
+            canvas.draw_idle()
+            return
+
+        canvas.restore_region(self.background)
+        for artist in self.artists():
+            self.figure.draw_artist(artist)
+        canvas.blit(self.figure.bbox)
@@ -0,0 +1,132 @@
+from cube import DIMENSIONS, DIMENSION_SCHEMA, StatsCube, RESULT_KEYS, dimension_schema, stats_dict
+from bitmap import BitmapIndex
+from dataset import MISSING_LABEL
+from snapshot import load_source
+from ingest import CHUNK_ROWS, is_pattern, is_streamed, parallel_cube, stream_cube
+from resultcache import format_key, streamed_digest
+
+DEFAULT_SOURCE = "llc_pad_diabetes_w_amps_10yrs.xlsx"
+
+# selection fields of the default dimensions, in the order of the cube dimensions
+SELECTION_FIELDS = [d[0] for d in DIMENSION_SCHEMA]
+
+
+class StatsEngine:
+
+    def __init__(self, data, materialise=False, cube=None, dimensions=None):
+        # data is None for streamed sources, which only keep the per-cell sums
+        self.data = data
+        self.cube = StatsCube(data, dimensions or DIMENSIONS) if cube is None else cube
+        self.schema = dimension_schema(self.cube.dimensions)
+        self.fields = [d[0] for d in self.schema]
+        # identifies the source data for persistent result caches; set by load_engine
+        self.dataset_key = None
+        self._index = None
+        self._levels = None
+        if materialise:
+            self.cube.materialise()
+
+    @property
+    def index(self):
+        # built on first use; only row-level queries need it
+        if self._index is None:
+            if self.data is None:
+                raise ValueError("row-level filters need a row-level source; streamed sources keep only per-cohort sums")
+            self._index = BitmapIndex(self.data)
+
+        return self._index
+
+    def options(self):
+        # grouping column -> its distinct values, as found in the data
+        return {
+            column: [value for value in values.tolist() if value != MISSING_LABEL]
+            for column, values in zip(self.cube.dimensions, self.cube.levels)
+        }
+
+    def validate(self, selection):
+        # a label that is not in the data (a typo, or a label split on its
+        # comma) would otherwise select nothing and give a row of zeros
+        if self._levels is None:
+            self._levels = [set(values.tolist()) for values in self.cube.levels]
+        unknown = [
+            "{0}={1!r}".format(field, value)
+            for field, levels, values in zip(self.fields, self._levels, selection)
+            for value in values if value not in levels
+        ]
+        if unknown:
+            raise ValueError("unknown option(s): " + ", ".join(unknown))
+
+        return selection
+
+    def compute_stats(self, *selections, **filters):
+        # positional selections follow self.fields; a keyword names a field
+        # (llc=[...]) or any other column (year=[...]), the latter going
+        # through the row index
+        selections = list(selections) + [()] * (len(self.fields) - len(selections))
+        for d, field in enumerate(self.fields):
+            if field in filters:
+                selections[d] = filters.pop(field)
+        if any(filters.values()):
+            return self.compute_rows(dict(zip(self.cube.dimensions, selections), **filters))
+
+        return self.cube.stats(*selections)
+
+    def compute_rows(self, filters):
+        return self.index.stats(filters)
+
+    def compute_many(self, selections):
+        return self.cube.stats_many(selections)
+
+    def compute_cohorts(self, selections):
+        # one stats dict per selection, from a single stats_many pass
+        results = self.compute_many(selections)
+        return [stats_dict({key: results[key][i] for key in RESULT_KEYS}) for i in range(len(selections))]
+
+    def all_selections(self):
+        return self.cube.all_selections()
+
+
+def load_engine(path=DEFAULT_SOURCE, rebuild=False, check="stat", materialise=False, chunk_rows=CHUNK_ROWS, progress=None, workers=1, dimensions=None):
+    # workers=None uses every core; several workers or a glob pattern of
+    # sources pre-aggregate partitions in a process pool. dimensions are the
+    # grouping columns offered for selection (default: DIMENSIONS)
+    dimensions = list(dimensions or DIMENSIONS)
+    if is_streamed(path):
+        # fingerprinted before and after reading: if a file changed meanwhile
+        # the sums may mix versions, and the engine gets no dataset_key
+        digest = streamed_digest(path)
+        if workers == 1 and not is_pattern(path):
+            cube = stream_cube(path, chunk_rows, progress, dimensions)
+        else:
+            cube = parallel_cube(path, workers, chunk_rows, progress, dimensions)
+        engine = StatsEngine(None, materialise=materialise, cube=cube)
+        engine.dataset_key = format_key(digest) if streamed_digest(path) == digest else None
+        return engine
+
+    data = load_source(path, rebuild=rebuild, check=check)
+    engine = StatsEngine(data, materialise=materialise, dimensions=dimensions)
+    engine.dataset_key = format_key(data.source_hash)
+
+    return engine
+
+
+_default_engine = None
+
+
+def default_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = load_engine()
+
+    return _default_engine
+
+
+def compute_stats(llc=(), pad=(), diabetes=(), engine=None, **filters):
+    if engine is None:
+        engine = default_engine()
+
+    return engine.compute_stats(llc, pad, diabetes, **filters)
+
+
+def empty_stats():
+    return dict.fromkeys(RESULT_KEYS, 0)
@@ -0,0 +1,265 @@
+import itertools
+import numpy as np
+
+# (selection field, grouping column, checkbox group title); the GUI, batch files
+# and HTTP parameters use the field names, the cube the columns
+DIMENSION_SCHEMA = [
+    ('llc', 'psg_llc', 'LLC'),
+    ('pad', 'psg_pad', 'PAD'),
+    ('diabetes', 'psg_diabetes', 'Diabetes')
+]
+
+DIMENSIONS = [d[1] for d in DIMENSION_SCHEMA]
+
+# labels of the standard workbook, offered until a source's own are known
+KNOWN_LEVELS = {
+    'psg_llc': [
+        '1. Gangrene', '2. Osteomyelitis, Foot', '3. Skin Ulcer, Foot', '4. Osteomyelitis, Lower Limb',
+        '5. Skin Ulcer, Lower Limb', '6. Cellulitis, Lower Limb', '7. Cellulitis, Toe'
+    ],
+    'psg_pad': ['PAD', 'WO PAD'],
+    'psg_diabetes': ['Diabetes', 'WO Diabetes', 'WO Diabetes, Gangrene NEC']
+}
+HIN_COLUMN = "hin_flag"
+UNIQUE_HIN = "Unique HIN"
+
+# (result key, summed column, only rows flagged 'Unique HIN')
+COUNT_METRICS = [
+    ('discharges_and_ds', 'discharges_and_ds', False),
+    ('unique_patients_ip_ds', 'unique_patients_ip_ds', True),
+    ('ed_v', 'ed_v', False),
+    ('unique_patients_ed', 'unique_patients_ed', True)
+]
+
+# (result key, numerator column, denominator column)
+RATIO_METRICS = [
+    # IP & DS
+    ('alos', 'days', 'discharges'),
+    ('discharges_and_ds_per_pat', 'discharges_and_ds', 'unique_patients_ip_ds'),
+    ('major_during', 'major_during', 'discharges_and_ds'),
+    ('minor_during', 'minor_during', 'discharges_and_ds'),
+    ('lpr_during', 'lpr_during', 'discharges_and_ds'),
+    ('major_1yr', 'major_1yr', 'discharges_and_ds'),
+    ('minor_1yr', 'minor_1yr', 'discharges_and_ds'),
+    ('lpr_1yr', 'lpr_1yr', 'discharges_and_ds'),
+    ('major_3yr', 'major_3yr', 'discharges_and_ds'),
+    ('minor_3yr', 'minor_3yr', 'discharges_and_ds'),
+    ('lpr_3yr', 'lpr_3yr', 'discharges_and_ds'),
+    ('major_5yr', 'major_5yr', 'discharges_and_ds'),
+    ('minor_5yr', 'minor_5yr', 'discharges_and_ds'),
+    ('lpr_5yr', 'lpr_5yr', 'discharges_and_ds'),
+
+    # ED
+    ('ed_visits_per_pat', 'ed_v', 'unique_patients_ed'),
+    ('major_amp_1yr', 'major_amp_1yr', 'ed_v'),
+    ('minor_amp_1yr', 'minor_amp_1yr', 'ed_v'),
+    ('lower_pr_1yr', 'lower_pr_1yr', 'ed_v'),
+    ('major_amp_3yr', 'major_amp_3yr', 'ed_v'),
+    ('minor_amp_3yr', 'minor_amp_3yr', 'ed_v'),
+    ('lower_pr_3yr', 'lower_pr_3yr', 'ed_v'),
+    ('major_amp_5yr', 'major_amp_5yr', 'ed_v'),
+    ('minor_amp_5yr', 'minor_amp_5yr', 'ed_v'),
+    ('lower_pr_5yr', 'lower_pr_5yr', 'ed_v')
+]
+
+SUM_COLUMNS = list(dict.fromkeys(
+    [m[1] for m in COUNT_METRICS] + [c for m in RATIO_METRICS for c in m[1:]]
+))
+
+RESULT_KEYS = [
+    'discharges_and_ds', 'alos', 'discharges_and_ds_per_pat', 'unique_patients_ip_ds',
+    'major_during', 'minor_during', 'lpr_during',
+    'major_1yr', 'minor_1yr', 'lpr_1yr',
+    'major_3yr', 'minor_3yr', 'lpr_3yr',
+    'major_5yr', 'minor_5yr', 'lpr_5yr',
+    'ed_v', 'unique_patients_ed', 'ed_visits_per_pat',
+    'major_amp_1yr', 'minor_amp_1yr', 'lower_pr_1yr',
+    'major_amp_3yr', 'minor_amp_3yr', 'lower_pr_3yr',
+    'major_amp_5yr', 'minor_amp_5yr', 'lower_pr_5yr'
+]
+
+
+def results_from_sums(totals, unique, rows):
+    # totals/unique hold SUM_COLUMNS along the last axis, summed over all rows and
+    # over 'Unique HIN' rows respectively; rows is the matching row count
+    totals = np.asarray(totals, dtype=np.float64)
+    unique = np.asarray(unique, dtype=np.float64)
+    empty = np.asarray(rows) == 0
+    col = {c: j for j, c in enumerate(SUM_COLUMNS)}
+
+    results = {}
+    for key, column, unique_only in COUNT_METRICS:
+        source = unique if unique_only else totals
+        results[key] = np.where(empty, 0, source[..., col[column]])
+    for key, numerator, denominator in RATIO_METRICS:
+        den = totals[..., col[denominator]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = totals[..., col[numerator]] / den
+        results[key] = np.where(empty | (den <= 0), 0, ratio)
+
+    return results
+
+
+def dimension_schema(columns=None):
+    # schema entries for the given grouping columns; a column outside
+    # DIMENSION_SCHEMA (e.g. a year or region column) is its own field and title
+    known = {d[1]: d for d in DIMENSION_SCHEMA}
+    return [known.get(column, (column, column, column)) for column in (columns or DIMENSIONS)]
+
+
+def _factorize(table, column):
+    if getattr(table, "is_categorical", None) and table.is_categorical(column):
+        return table.factorize(column)
+
+    values, inverse = np.unique(np.asarray(table[column]).astype(str), return_inverse=True)
+    return values, inverse.ravel()
+
+
+def stats_dict(results):
+    counts = {m[0] for m in COUNT_METRICS}
+    return {
+        key: int(round(float(results[key]))) if key in counts else float(results[key])
+        for key in RESULT_KEYS
+    }
+
+
+class StatsCube:
+
+    def __init__(self, table, dimensions=DIMENSIONS, materialise=False):
+        self.dimensions = list(dimensions)
+        self.levels = []
+        codes = []
+        for column in self.dimensions:
+            values, inverse = _factorize(table, column)
+            self.levels.append(values)
+            codes.append(inverse)
+
+        hin_levels, hin_codes = _factorize(table, HIN_COLUMN)
+        hin = (hin_levels == UNIQUE_HIN)[hin_codes]
+        shape = [len(values) for values in self.levels] + [2]
+        flat = np.ravel_multi_index(codes + [hin.astype(np.intp)], shape)
+        cells, cell_of_row = np.unique(flat, return_inverse=True)
+        cell_of_row = cell_of_row.ravel()
+        unravelled = np.unravel_index(cells, shape)
+
+        self.cell_codes = np.column_stack(unravelled[:-1]) if self.dimensions else np.empty((len(cells), 0), np.intp)
+        self.cell_unique = unravelled[-1].astype(bool)
+        self.rows = np.bincount(cell_of_row, minlength=len(cells))
+        self.sums = np.zeros((len(cells), len(SUM_COLUMNS)))
+        for j, column in enumerate(SUM_COLUMNS):
+            weights = np.nan_to_num(np.asarray(table[column], dtype=np.float64))
+            self.sums[:, j] = np.bincount(cell_of_row, weights=weights, minlength=len(cells))
+
+        self.cache = {}
+        if materialise:
+            self.materialise()
+
+    @classmethod
+    def from_sums(cls, levels, cell_codes, cell_unique, rows, sums, dimensions=DIMENSIONS):
+        cube = cls.__new__(cls)
+        cube.dimensions = list(dimensions)
+        cube.levels = [np.asarray(values, dtype=str) for values in levels]
+        cube.cell_codes = np.asarray(cell_codes, dtype=np.intp).reshape(len(rows), len(cube.dimensions))
+        cube.cell_unique = np.asarray(cell_unique, dtype=bool)
+        cube.rows = np.asarray(rows, dtype=np.int64)
+        cube.sums = np.asarray(sums, dtype=np.float64).reshape(len(rows), len(SUM_COLUMNS))
+        cube.cache = {}
+
+        return cube
+
+    @classmethod
+    def merge(cls, cubes):
+        # exact reduction of cubes built from disjoint parts of the same source;
+        # levels are matched by label since each part discovers its own
+        cubes = list(cubes)
+        dimensions = cubes[0].dimensions
+        levels = [
+            np.array(sorted(set().union(*(c.levels[d].tolist() for c in cubes))), dtype=str)
+            for d in range(len(dimensions))
+        ]
+        lookups = [{value: k for k, value in enumerate(values.tolist())} for values in levels]
+
+        keys = []
+        for c in cubes:
+            columns = [
+                np.array([lookups[d][v] for v in c.levels[d].tolist()], dtype=np.intp)[c.cell_codes[:, d]]
+                for d in range(len(dimensions))
+            ]
+            keys.append(np.column_stack(columns + [c.cell_unique.astype(np.intp)]))
+        cells, inverse = np.unique(np.vstack(keys), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+
+        rows = np.zeros(len(cells), dtype=np.int64)
+        sums = np.zeros((len(cells), len(SUM_COLUMNS)))
+        np.add.at(rows, inverse, np.concatenate([c.rows for c in cubes]))
+        np.add.at(sums, inverse, np.vstack([c.sums for c in cubes]))
+
+        return cls.from_sums(levels, cells[:, :-1], cells[:, -1], rows, sums, dimensions)
+
+    @staticmethod
+    def selection_key(*selections):
+        return tuple(frozenset(selected) for selected in selections)
+
+    def cell_mask(self, *selections):
+        # an unticked group does not filter; nothing ticked anywhere selects nothing
+        mask = np.full(len(self.rows), any(selections))
+        for d, selected in enumerate(selections):
+            if selected:
+                allowed = np.array([value in selected for value in self.levels[d].tolist()])
+                mask &= allowed[self.cell_codes[:, d]]
+
+        return mask
+
+    def stats(self, *selections):
+        key = self.selection_key(*selections)
+        if key in self.cache:
+            return dict(self.cache[key])
+
+        mask = self.cell_mask(*selections)
+        return stats_dict(results_from_sums(
+            self.sums[mask].sum(axis=0),
+            self.sums[mask & self.cell_unique].sum(axis=0),
+            self.rows[mask].sum()
+        ))
+
+    def all_selections(self):
+        powersets = [
+            [tuple(c) for r in range(len(values) + 1) for c in itertools.combinations(values.tolist(), r)]
+            for values in self.levels
+        ]
+
+        return list(itertools.product(*powersets))
+
+    def indicator(self, selections):
+        # selection-by-cell 0/1 matrix, built one dimension at a time
+        n = len(selections)
+        active = np.zeros((n, len(self.dimensions)), dtype=bool)
+        indicator = np.ones((n, len(self.rows)), dtype=bool)
+        for d, values in enumerate(self.levels):
+            position = {value: k for k, value in enumerate(values.tolist())}
+            allowed = np.zeros((n, len(values)), dtype=bool)
+            for i, selection in enumerate(selections):
+                if selection[d]:
+                    active[i, d] = True
+                    allowed[i, [position[v] for v in selection[d] if v in position]] = True
+            indicator &= allowed[:, self.cell_codes[:, d]] | ~active[:, d, None]
+
+        indicator &= active.any(axis=1)[:, None]
+        return indicator
+
+    def stats_many(self, selections):
+        indicator = self.indicator(selections).astype(np.float64)
+
+        return results_from_sums(
+            indicator @ self.sums,
+            indicator @ (self.sums * self.cell_unique[:, None]),
+            indicator @ self.rows
+        )
+
+    def materialise(self):
+        selections = self.all_selections()
+        results = self.stats_many(selections)
+        for i, selection in enumerate(selections):
+            self.cache[self.selection_key(*selection)] = stats_dict({key: results[key][i] for key in RESULT_KEYS})
+
+        return len(self.cache)
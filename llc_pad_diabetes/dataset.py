@@ -0,0 +1,107 @@
+import numpy as np
+
+MISSING_LABEL = "nan"
+
+
+def narrow(values):
+    # smallest integer dtype that holds every value; floats stay floats unless
+    # they are all whole numbers (Excel hands counters back as float64)
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        return values.astype(np.uint8)
+    if values.dtype.kind == "f":
+        if len(values) == 0 or not np.all(np.isfinite(values)) or not np.all(values == np.round(values)):
+            return values
+        values = values.astype(np.int64)
+    if values.dtype.kind not in "iu" or len(values) == 0:
+        return values
+
+    dtype = np.promote_types(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+    return values.astype(dtype, copy=False)
+
+
+def code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+
+    return np.int64
+
+
+class Dataset:
+    # column store for the source sheet: text columns as category codes,
+    # counters in their narrowest integer dtype
+
+    def __init__(self, columns, codes, categories, values):
+        self.columns = list(columns)
+        self.codes = codes
+        self.categories = categories
+        self.values = values
+        # sha256 of the source file bytes this data was read from, when known
+        self.source_hash = None
+
+    @classmethod
+    def from_frame(cls, df):
+        import pandas as pd
+
+        codes, categories, values = {}, {}, {}
+        for name in df.columns:
+            series = df[name]
+            if pd.api.types.is_numeric_dtype(series.dtype):
+                values[str(name)] = narrow(series.to_numpy())
+            else:
+                categorical = pd.Categorical(series)
+                categories[str(name)] = [str(c) for c in categorical.categories]
+                codes[str(name)] = categorical.codes.astype(code_dtype(len(categorical.categories)))
+
+        return cls([str(name) for name in df.columns], codes, categories, values)
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        first = self.columns[0]
+        return len(self.codes[first] if first in self.codes else self.values[first])
+
+    def __contains__(self, column):
+        return column in self.codes or column in self.values
+
+    def __getitem__(self, column):
+        if column in self.codes:
+            labels = np.array(self.categories[column] + [MISSING_LABEL], dtype=object)
+            return labels[self.codes[column]]
+
+        return self.values[column]
+
+    def is_categorical(self, column):
+        return column in self.codes
+
+    def factorize(self, column):
+        # (levels, non-negative codes); missing values become their own level
+        codes = self.codes[column]
+        levels = list(self.categories[column])
+        if len(codes) and codes.min() < 0:
+            codes = np.where(codes < 0, len(levels), codes)
+            levels.append(MISSING_LABEL)
+
+        return np.array(levels, dtype=str), codes
+
+    def sums(self, columns, rows=None):
+        # rows is a boolean mask or row ids; the selected values are gathered by
+        # id, which is several times faster than a masked reduction
+        if rows is not None and np.asarray(rows).dtype == bool:
+            rows = np.flatnonzero(rows)
+        totals = {}
+        for column in columns:
+            values = self.values[column] if rows is None else self.values[column][rows]
+            # blank counter cells (NaN) count as 0, as in the StatsCube sums
+            if values.dtype.kind in "iu":
+                totals[column] = values.sum(dtype=np.int64)
+            else:
+                totals[column] = np.nansum(values, dtype=np.float64)
+
+        return totals
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.codes.values()) + sum(a.nbytes for a in self.values.values())
+
@@ -0,0 +1,114 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from cube import DIMENSION_SCHEMA
+
+FIGSIZE = (5, 7)
+DPI = 200
+
+_renderer = None
+
+
+class ChartRenderer:
+    # one Agg figure whose artists are reused for every cohort; the layout is
+    # computed once since only bar heights and label text change
+
+    def __init__(self, dpi=DPI):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from charts import ProbabilityChart
+
+        self.figure = Figure(figsize=FIGSIZE, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.chart = ProbabilityChart(self.figure)
+        self.caption = self.figure.suptitle(selection_caption([()] * len(DIMENSION_SCHEMA)))
+        self.figure.tight_layout()
+
+    def render(self, caption, stats):
+        self.caption.set_text(caption)
+        self.chart.update(stats)
+
+    def save(self, caption, stats, path):
+        self.render(caption, stats)
+        self.figure.savefig(path)
+
+
+def selection_caption(selection, schema=DIMENSION_SCHEMA):
+    labels = ["{0}: {1}".format(title, ", ".join(values) or "all") for (field, column, title), values in zip(schema, selection)]
+    return labels[0] + "\n" + "  ".join(labels[1:])
+
+
+def file_name(index, selection):
+    slug = "_".join(re.sub(r"[^A-Za-z0-9]+", "-", "+".join(values) or "all").strip("-") for values in selection)
+    return "{0:04d}_{1}.png".format(index, slug[:120])
+
+
+def _init_worker(dpi):
+    global _renderer
+    _renderer = ChartRenderer(dpi)
+
+
+def _render_pngs(jobs):
+    for path, caption, stats in jobs:
+        _renderer.save(caption, stats, path)
+
+    return len(jobs)
+
+
+def export_pngs(selections, stats, directory, workers=None, dpi=DPI, progress=None, schema=DIMENSION_SCHEMA):
+    os.makedirs(directory, exist_ok=True)
+    jobs = [
+        (os.path.join(directory, file_name(i, selection)), selection_caption(selection, schema), result)
+        for i, (selection, result) in enumerate(zip(selections, stats))
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(dpi)
+        batches = [[job] for job in jobs]
+        results = map(_render_pngs, batches)
+        pool = None
+    else:
+        # a few batches per worker keeps them busy without one task per chart; in a
+        # frozen build the workers re-run the executable, see freeze_support() in main
+        size = max(1, len(jobs) // (workers * 4))
+        batches = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dpi,))
+        results = pool.map(_render_pngs, batches)
+
+    done = 0
+    try:
+        for count in results:
+            done += count
+            if progress is not None:
+                progress(done, done / len(jobs))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return done
+
+
+def export_pdf(selections, stats, path, dpi=DPI, progress=None, schema=DIMENSION_SCHEMA):
+    # a multi-page PDF is written by one process, one page per cohort
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    renderer = ChartRenderer(dpi)
+    with PdfPages(path) as pdf:
+        for i, (selection, result) in enumerate(zip(selections, stats), 1):
+            renderer.render(selection_caption(selection, schema), result)
+            pdf.savefig(renderer.figure)
+            if progress is not None:
+                progress(i, i / len(selections))
+
+    return len(selections)
+
+
+def run_export(engine, source, out, workers=None, dpi=DPI, progress=None):
+    from batch import read_selections
+
+    selections = engine.all_selections() if source == "all" else list(read_selections(source, engine.fields, engine.validate))
+    stats = engine.compute_cohorts(selections)
+    if out.lower().endswith(".pdf"):
+        return export_pdf(selections, stats, out, dpi, progress, engine.schema)
+
+    return export_pngs(selections, stats, out, workers, dpi, progress, engine.schema)
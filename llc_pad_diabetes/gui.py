@@ -0,0 +1,418 @@
+import functools
+import os
+import time
+from PyQt5.QtWidgets import QMainWindow, QWidget, QFormLayout, QGridLayout, QVBoxLayout, QHBoxLayout, QGroupBox, QLabel, QCheckBox, QTextBrowser, QShortcut, QPushButton, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont, QKeySequence
+from core import DEFAULT_SOURCE, empty_stats, load_engine
+from cube import KNOWN_LEVELS, StatsCube, dimension_schema
+from snapshot import read_categories
+from resultcache import READ_TIMEOUT_S, dataset_key
+from selection import SelectionModel
+from scheduler import RecomputeScheduler
+from reloader import SourceReloader
+from profiling import profiler
+import startup
+
+# rows of the comparison table: (section, [(label, resultsStats key, format)])
+INFO_METRICS = [
+    ('Inpatient & Day Surgery', [
+        ('Discharges & Day Surgeries', 'discharges_and_ds', '{0:0.0f}'),
+        ('ALOS', 'alos', '{0:0.0f}'),
+        ('Unique Patients', 'unique_patients_ip_ds', '{0:0.0f}'),
+        ('Discharges or Day Surgeries per Patient', 'discharges_and_ds_per_pat', '{0:0.1f}')
+    ]),
+    ('ED', [
+        ('ED Visits', 'ed_v', '{0:0.0f}'),
+        ('Unique ED Patients', 'unique_patients_ed', '{0:0.0f}'),
+        ('ED Visits per Patient', 'ed_visits_per_pat', '{0:0.1f}')
+    ])
+]
+
+
+class ToolWindow(QMainWindow):
+
+    def __init__(self, source=DEFAULT_SOURCE, load_options=None, result_cache=None):
+        super(ToolWindow, self).__init__()
+        self.title = 'Classification LLC X PAD X Diabetes'
+        self.width = 1300
+        self.height = 950
+        self.setWindowTitle(self.title)
+        self.setGeometry(0, 0, self.width, self.height)
+        self.setCentralWidget(ClassificationTool(source, load_options, result_cache))
+        self.setStyleSheet(
+            '''
+                QMainWindow {background-color: #fff}
+                QGroupBox {font-weight: bold; font-size: 12pt; color: #333}
+            '''
+        )
+        self.show()
+
+
+class ClassificationTool(QWidget):
+
+    def __init__(self, source=DEFAULT_SOURCE, load_options=None, result_cache=None):
+        super(ClassificationTool, self).__init__()
+
+        self.source = source
+        self.loadOptions = load_options or {}
+        # a ResultCache shared across sessions; its key for the source is known
+        # before loading when a fresh snapshot recorded the content hash
+        self.resultCache = result_cache
+        self.earlyKey = self.knownDatasetKey() if result_cache is not None else None
+
+        if profiler.enabled:
+            for name in ("getSourceData", "dfFilterAndAgg", "update_chart"):
+                setattr(self, name, profiler.wrap(name, getattr(self, name)))
+
+        self.toolLayout = QGridLayout()
+        self.setLayout(self.toolLayout)
+
+        # one checkbox group per grouping column; the options are the values
+        # found in the data (or in a fresh snapshot's metadata, before loading)
+        self.schema = dimension_schema(self.loadOptions.get("dimensions"))
+        self.optionLayouts = {}
+        self.optionLabels = {}
+
+        # the engine arrives from a background load after the window is shown;
+        # until then only cached results can be shown, other ticks are kept in
+        # the selection model and computed once it has loaded
+        self.engine = None
+        self.dataVersion = 0
+        self.dataStatus = "Loading {0}...".format(os.path.basename(self.source))
+
+        self.selection = SelectionModel([d[0] for d in self.schema])
+        self.scheduler = RecomputeScheduler(self.selection, self.dfFilterAndAgg, parent=self)
+        self.scheduler.resultsReady.connect(self.showResults)
+        self.scheduler.busyChanged.connect(self.showBusy)
+
+        self.resultsStats = empty_stats()
+
+        for i, (field, column, title) in enumerate(self.schema):
+            self.toolLayout.addWidget(self.createOptions(field, title), 0, i)
+        # provisional until the data is loaded: the last snapshot's labels, else the standard ones
+        self.setOptions(dict(KNOWN_LEVELS, **read_categories(self.source)))
+
+        # pinned cohorts, [selection, stats], compared against the live selection
+        self.pins = []
+        self.toolLayout.addWidget(self.createCompareBox(), 0, len(self.schema))
+        self.columns = len(self.schema) + 1
+
+        resultsBox = self.createOutputBox("Results")
+        self.resultsLayout = QHBoxLayout()
+        resultsBox.setLayout(self.resultsLayout)
+
+        self.creatInfoCard()
+        self.canvas = None
+        self.chart = None
+
+        self.toolLayout.addWidget(resultsBox, 1, 0, 2, self.columns)
+
+        self.statusLabel = QLabel()
+        self.statusLabel.setFont(QFont("Open Sans", 9))
+        self.toolLayout.addWidget(self.statusLabel, 3, 0, 1, self.columns)
+        self.showBusy(False)
+
+        self.reloader = SourceReloader(self.source, self.getSourceData, watch=os.path.isfile(self.source), parent=self)
+        self.reloader.reloaded.connect(self.swapEngine)
+        self.reloader.reloadFailed.connect(self.showReloadFailed)
+
+        if profiler.enabled:
+            self.createDebugPanel()
+
+        self.started = False
+
+    def paintEvent(self, event):
+        super(ClassificationTool, self).paintEvent(event)
+        if not self.started:
+            # the window is on screen before matplotlib and the data are loaded
+            self.started = True
+            startup.mark("first paint")
+            QTimer.singleShot(0, self.startLoading)
+
+    def startLoading(self):
+        self.reloader.reload(force=True)
+        self.createChart()
+
+    def createChart(self):
+        # matplotlib is only imported here, while the data loads
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+        self.canvas = FigureCanvas(Figure(figsize=(5, 7), dpi=200, tight_layout=True))
+        self.resultsLayout.addWidget(self.canvas)
+        self.insert_ax()
+        if profiler.enabled:
+            self.canvas.draw = profiler.wrap("canvas.draw", self.canvas.draw)
+        startup.mark("chart ready")
+
+    def getSourceData(self, path):
+        # the engine's dataset_key comes from the bytes that were parsed
+        return load_engine(path, **self.loadOptions)
+
+    def knownDatasetKey(self):
+        try:
+            return dataset_key(self.source, hash_file=False)
+        except OSError:
+            return None
+
+    # creat form method
+
+    def createOptions(self, field, title):
+        
+        inputGroupBox = QGroupBox(title)
+        inputGroupBox.setFont(QFont('Open Sans', 10))
+        inputLayout = QFormLayout()
+        inputGroupBox.setLayout(inputLayout)
+        self.optionLayouts[field] = inputLayout
+
+        return inputGroupBox
+
+    def setOptions(self, levels):
+        # (re)builds the checkboxes of every group whose values changed; ticks
+        # on values that are still there survive, the others are dropped
+        for field, column, title in self.schema:
+            labels = levels.get(column)
+            if labels is None or labels == self.optionLabels.get(field):
+                continue
+
+            inputLayout = self.optionLayouts[field]
+            while inputLayout.rowCount():
+                inputLayout.removeRow(0)
+            for value in list(self.selection.selected[field]):
+                if value not in labels:
+                    self.selection.set(field, value, False)
+            for label in labels:
+                b = QCheckBox(label)
+                b.setChecked(label in self.selection.selected[field])
+                b.stateChanged.connect(functools.partial(self.selection.set, field, label))
+                inputLayout.addRow(b)
+            self.optionLabels[field] = labels
+
+    def createCompareBox(self):
+        compareGroupBox = QGroupBox("Compare")
+        compareGroupBox.setFont(QFont('Open Sans', 10))
+        compareLayout = QVBoxLayout()
+
+        pinButton = QPushButton("Pin selection")
+        pinButton.clicked.connect(self.pinSelection)
+        clearButton = QPushButton("Clear pins")
+        clearButton.clicked.connect(self.clearPins)
+        self.pinList = QListWidget()
+        self.pinList.setToolTip("Double-click a pinned cohort to remove it")
+        self.pinList.itemDoubleClicked.connect(lambda item: self.unpin(self.pinList.row(item)))
+
+        compareLayout.addWidget(pinButton)
+        compareLayout.addWidget(clearButton)
+        compareLayout.addWidget(self.pinList)
+        compareGroupBox.setLayout(compareLayout)
+
+        return compareGroupBox
+
+    def pinSelection(self):
+        from charts import MAX_COHORTS
+
+        version, selection = self.selection.snapshot()
+        # the same options ticked in another order are the same cohort
+        key = StatsCube.selection_key(*selection)
+        pinned = any(StatsCube.selection_key(*pin[0]) == key for pin in self.pins)
+        if not any(selection) or pinned or len(self.pins) + 1 >= MAX_COHORTS:
+            return
+
+        stats = self.engine.compute_cohorts([selection])[0] if self.engine is not None else None
+        self.pins.append([selection, stats])
+        self.showPins()
+
+    def unpin(self, row):
+        del self.pins[row]
+        self.showPins()
+
+    def clearPins(self):
+        if self.pins:
+            self.pins = []
+            self.showPins()
+
+    def computePins(self):
+        # all pinned cohorts in one stats_many pass over the cube
+        if self.pins and self.engine is not None:
+            for pin, stats in zip(self.pins, self.engine.compute_cohorts([pin[0] for pin in self.pins])):
+                pin[1] = stats
+
+    def updatePins(self):
+        # new data, same cohorts: only the pinned bars' values change
+        if not self.pins:
+            return
+        self.computePins()
+        self.updateInfoCard()
+        if self.chart is not None:
+            changed = [self.chart.update(stats, cohort) for cohort, (selection, stats) in enumerate(self.pins, 1)]
+            if any(changed):
+                self.chart.redraw()
+
+    def showPins(self):
+        # the number of cohorts changed: the chart is rebuilt with one bar
+        # series per cohort; value changes afterwards only touch their own bars
+        from export import selection_caption
+
+        self.pinList.clear()
+        for i, (selection, stats) in enumerate(self.pins, 1):
+            caption = selection_caption(selection, self.schema)
+            item = QListWidgetItem("Pin {0}: {1}".format(i, caption.replace("\n", "  ")))
+            item.setToolTip(caption)
+            self.pinList.addItem(item)
+        self.updateInfoCard()
+        if self.chart is not None:
+            self.chart.remove()
+            self.canvas.figure.clear()
+            self.insert_ax()
+
+    def createOutputBox(self, group_name):
+
+        outputGroupBox = QGroupBox(group_name)
+        outputGroupBox.setFont(QFont('Open Sans', 10))
+
+        return outputGroupBox
+
+    def infoText(self):
+        return '''
+                <span style=font-size:10pt> <em>Inpatient & Day Surgery</em> </span><br><br>
+                Discherges & Day Surgeries: <span style=color:#b22222>{0[discharges_and_ds]:0.0f}</span> <br>
+                ALOS: <span style=color:#b22222>{0[alos]:0.0f}</span> <br>
+                Unique Patients: <span style=color:#b22222>{0[unique_patients_ip_ds]:0.0f}</span> <br>
+                Discharges or Day Surgeries per Patient: <span style=color:#b22222>{0[discharges_and_ds_per_pat]:0.1f}</span> <br><br><br><br>
+
+                <span style=font-size:10pt> <em>ED</em> </span><br><br>
+                ED Visits: <span style=color:#b22222>{0[ed_v]:0.0f}</span> <br>
+                Unique ED Patients: <span style=color:#b22222>{0[unique_patients_ed]:0.0f}</span> <br>
+                ED Visits per Patient: <span style=color:#b22222>{0[ed_visits_per_pat]:0.1f}</span> <br><br>
+            '''.format(self.resultsStats)
+
+    def creatInfoCard(self):
+        self.displayStats = QLabel()
+        self.displayStats.setFont(QFont("Open Sans", 10))
+        self.displayStats.setAlignment(Qt.AlignTop)	
+        self.displayStats.setText(self.infoText())
+
+        self.resultsLayout.addWidget(self.displayStats)
+
+    def compareText(self):
+        cohorts = [("Current", self.resultsStats)] + [("Pin {0}".format(i), stats) for i, (selection, stats) in enumerate(self.pins, 1)]
+        header = "".join("<th align=right>&nbsp;{0}</th>".format(name) for name, stats in cohorts)
+        rows = []
+        for section, metrics in INFO_METRICS:
+            rows.append("<tr><td colspan={0}><br><em>{1}</em></td></tr>".format(len(cohorts) + 1, section))
+            for label, key, fmt in metrics:
+                cells = "".join(
+                    "<td align=right style=color:#b22222>&nbsp;{0}</td>".format("-" if stats is None else fmt.format(stats[key]))
+                    for name, stats in cohorts
+                )
+                rows.append("<tr><td>{0}</td>{1}</tr>".format(label, cells))
+
+        return "<table><tr><th></th>{0}</tr>{1}</table>".format(header, "".join(rows))
+
+    def updateInfoCard(self):
+        self.displayStats.setText(self.compareText() if self.pins else self.infoText())
+
+    def dfFilterAndAgg(self, *selections):
+        # the shared cache is only read while the data loads: once the engine
+        # is there the cube answers faster than any read of the drive
+        engine = self.engine
+        if self.resultCache is None:
+            key = None
+        else:
+            key = self.earlyKey if engine is None else engine.dataset_key
+        if engine is None:
+            if key is None:
+                return None
+            return self.resultCache.get_stats(key, self.selection.fields, selections, READ_TIMEOUT_S)
+
+        stats = engine.compute_stats(*selections)
+        if key is not None:
+            # written on the cache's own thread, so the result is not held up by the drive
+            self.resultCache.put_stats_later(key, self.selection.fields, selections, stats)
+
+        return stats
+
+    def showResults(self, version, stats):
+        if stats is None:
+            # not cached and the data is still loading
+            return
+
+        self.resultsStats = stats
+        self.updateInfoCard()
+        self.update_chart()
+        startup.mark("first results")
+
+    def showBusy(self, busy):
+        self.statusLabel.setText("Computing...    " + self.dataStatus if busy else self.dataStatus)
+
+    def describeData(self, loaded, seconds):
+        return "Data version {0}, loaded {1} in {2:.1f} s".format(
+            self.dataVersion, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(loaded)), seconds
+        )
+
+    def swapEngine(self, engine, seconds):
+        # a single reference swap on the GUI thread; the old engine and its
+        # cached cohorts are dropped, and the current selection is recomputed
+        self.engine = engine
+        self.setOptions(engine.options())
+        self.dataVersion += 1
+        self.dataStatus = self.describeData(time.time(), seconds)
+        startup.mark("data loaded")
+        self.updatePins()
+        self.selection.refresh()
+        self.showBusy(self.scheduler.inFlight)
+
+    def createDebugPanel(self):
+        # hidden until Ctrl+Shift+P; Ctrl+Shift+T writes a Chrome trace file
+        self.debugPanel = QLabel()
+        self.debugPanel.setFont(QFont("Monospace", 8))
+        self.debugPanel.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.debugPanel.hide()
+        self.toolLayout.addWidget(self.debugPanel, 4, 0, 1, self.columns)
+
+        self.debugTimer = QTimer(self)
+        self.debugTimer.setInterval(1000)
+        self.debugTimer.timeout.connect(self.updateDebugPanel)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, self.toggleDebugPanel)
+        QShortcut(QKeySequence("Ctrl+Shift+T"), self, self.dumpTrace)
+
+    def toggleDebugPanel(self):
+        visible = not self.debugPanel.isVisible()
+        self.debugPanel.setVisible(visible)
+        if visible:
+            self.updateDebugPanel()
+            self.debugTimer.start()
+        else:
+            self.debugTimer.stop()
+
+    def updateDebugPanel(self):
+        self.debugPanel.setText("<pre>{0}</pre>".format(profiler.summary_text()))
+
+    def dumpTrace(self):
+        path = profiler.dump(profiler.trace_path or "llc_pad_diabetes_trace.json")
+        self.statusLabel.setText("Trace written to {0}; {1}".format(path, self.dataStatus))
+
+    def showReloadFailed(self, message):
+        if self.engine is None:
+            self.statusLabel.setText("Loading {0} failed: {1}".format(self.source, message))
+        else:
+            self.statusLabel.setText("Reload failed ({0}); {1}".format(message, self.dataStatus))
+
+    def insert_ax(self):
+        from charts import ProbabilityChart
+
+        labels = ["Current"] + ["Pin {0}".format(i) for i in range(1, len(self.pins) + 1)]
+        self.chart = ProbabilityChart(self.canvas.figure, animated=True, cohorts=len(labels), cohort_labels=labels)
+        if profiler.enabled:
+            self.chart.redraw = profiler.wrap("chart.redraw", self.chart.redraw)
+        # results (cached or pinned) may have arrived before this chart existed
+        self.chart.update(self.resultsStats)
+        for cohort, (selection, stats) in enumerate(self.pins, 1):
+            if stats is not None:
+                self.chart.update(stats, cohort)
+        self.canvas.draw_idle()
+
+    def update_chart(self):
+        if self.chart is not None and self.chart.update(self.resultsStats):
+            self.chart.redraw()
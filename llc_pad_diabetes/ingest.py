@@ -0,0 +1,277 @@
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cube import DIMENSIONS, HIN_COLUMN, SUM_COLUMNS, StatsCube
+from dataset import MISSING_LABEL
+
+CHUNK_ROWS = 250000
+STREAM_FORMATS = (".csv", ".parquet")
+
+
+def is_pattern(path):
+    return glob.has_magic(path)
+
+
+def is_streamed(path):
+    return is_pattern(path) or os.path.splitext(path)[1].lower() in STREAM_FORMATS
+
+
+def needed_columns(dimensions=DIMENSIONS):
+    return list(dimensions) + [HIN_COLUMN] + SUM_COLUMNS
+
+
+def iter_csv(path, chunk_rows, columns):
+    import pandas as pd
+
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_rows, usecols=columns):
+            # the reader runs ahead of the chunk it returns, so this is approximate
+            yield chunk, min(f.tell() / size, 1.0)
+
+
+def parquet_file(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("reading Parquet input requires pyarrow")
+
+    return pq.ParquetFile(path)
+
+
+def parquet_column(array):
+    # nulls in text columns become MISSING_LABEL, as blank cells do when a
+    # CSV or the workbook is read, rather than the label 'None'
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if array.null_count:
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            array = pc.fill_null(array, MISSING_LABEL)
+
+    return array.to_numpy(zero_copy_only=False)
+
+
+def iter_parquet(path, chunk_rows, columns, row_groups=None):
+    source = parquet_file(path)
+    if row_groups is None:
+        total = source.metadata.num_rows or 1
+    else:
+        total = sum(source.metadata.row_group(i).num_rows for i in row_groups) or 1
+    done = 0
+    for batch in source.iter_batches(batch_size=chunk_rows, columns=columns, row_groups=row_groups):
+        done += batch.num_rows
+        chunk = {name: parquet_column(batch.column(i)) for i, name in enumerate(batch.schema.names)}
+        yield chunk, done / total
+
+
+def iter_chunks(path, chunk_rows=CHUNK_ROWS, columns=None):
+    columns = needed_columns() if columns is None else columns
+    if path.lower().endswith(".parquet"):
+        return iter_parquet(path, chunk_rows, columns)
+
+    return iter_csv(path, chunk_rows, columns)
+
+
+def chunk_length(chunk):
+    return len(next(iter(chunk.values()))) if isinstance(chunk, dict) else len(chunk)
+
+
+class CubeAccumulator:
+    # folds chunks into the per-cell sums of a StatsCube; memory is bounded by
+    # one chunk plus the (small) cube, whatever the size of the source
+
+    def __init__(self, dimensions=DIMENSIONS):
+        self.dimensions = list(dimensions)
+        self.cube = None
+        self.rows = 0
+
+    def add(self, chunk):
+        if not chunk_length(chunk):
+            return
+        part = StatsCube(chunk, self.dimensions)
+        self.cube = part if self.cube is None else StatsCube.merge([self.cube, part])
+        self.rows += chunk_length(chunk)
+
+    def result(self):
+        if self.cube is None:
+            raise ValueError("no rows were read")
+
+        return self.cube
+
+
+def stream_cube(path, chunk_rows=CHUNK_ROWS, progress=None, dimensions=DIMENSIONS):
+    accumulator = CubeAccumulator(dimensions)
+    for chunk, fraction in iter_chunks(path, chunk_rows, needed_columns(dimensions)):
+        accumulator.add(chunk)
+        if progress is not None:
+            progress(accumulator.rows, fraction)
+
+    return accumulator.result()
+
+
+def stream_memory_report(path, chunk_rows=CHUNK_ROWS, dimensions=DIMENSIONS):
+    # the --memory-report of a .csv/.parquet source: traced memory per chunk
+    # while it is folded into the cube, against the cube that is kept
+    import gc
+    import tracemalloc
+    import pandas
+
+    sources = expand_sources(path)
+    if any(os.path.splitext(source)[1].lower() not in STREAM_FORMATS for source in sources):
+        raise SystemExit("--memory-report takes one workbook or .csv/.parquet extracts")
+
+    accumulator = CubeAccumulator(dimensions)
+    chunks = 0
+    chunk_peak = 0
+    tracemalloc.start()
+    try:
+        for source in sources:
+            for chunk, fraction in iter_chunks(source, chunk_rows, needed_columns(dimensions)):
+                accumulator.add(chunk)
+                chunks += 1
+                chunk_peak = max(chunk_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+        chunk = None
+        cube = accumulator.result()
+        gc.collect()
+        traced_with_cube = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    arrays = [cube.cell_codes, cube.cell_unique, cube.rows, cube.sums] + list(cube.levels)
+    return {
+        "rows": accumulator.rows,
+        "chunks": chunks,
+        "chunk_rows": chunk_rows,
+        "chunk_peak_bytes": chunk_peak,
+        "cube_bytes": int(sum(a.nbytes for a in arrays)),
+        "traced_with_cube": traced_with_cube
+    }
+
+
+class _ByteRange(io.RawIOBase):
+    # the header line followed by the whole lines of [begin, stop) of a CSV file
+
+    def __init__(self, f, header, begin, stop):
+        self.f = f
+        self.header = header
+        self.position = begin
+        self.stop = stop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.header:
+            n = min(len(buffer), len(self.header))
+            buffer[:n] = self.header[:n]
+            self.header = self.header[n:]
+            return n
+
+        n = min(len(buffer), self.stop - self.position)
+        if n <= 0:
+            return 0
+        self.f.seek(self.position)
+        data = self.f.read(n)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def line_boundary(f, offset, size):
+    # start of the first line that begins at or after offset
+    if offset <= 0:
+        return 0
+    if offset >= size:
+        return size
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def iter_csv_range(path, start, end, chunk_rows, columns):
+    # a line belongs to the range holding its first byte, so neighbouring ranges
+    # neither overlap nor skip rows (quoted fields must not contain newlines)
+    import pandas as pd
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        begin = max(line_boundary(f, start, size), len(header))
+        stop = max(line_boundary(f, end, size), begin)
+        reader = io.BufferedReader(_ByteRange(f, header, begin, stop))
+        span = (stop - begin) or 1
+        for chunk in pd.read_csv(reader, chunksize=chunk_rows, usecols=columns):
+            yield chunk, min((reader.raw.position - begin) / span, 1.0)
+
+
+def expand_sources(path):
+    paths = sorted(glob.glob(path)) if is_pattern(path) else [path]
+    if not paths:
+        raise FileNotFoundError(path)
+
+    return paths
+
+
+def partitions(paths, parts):
+    # (kind, path, argument) tasks: Parquet row groups, CSV byte ranges, whole workbooks
+    tasks = []
+    for path in paths:
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".parquet":
+            groups = list(range(parquet_file(path).num_row_groups))
+            step = max(1, -(-len(groups) // parts))
+            tasks.extend(("parquet", path, groups[i:i + step]) for i in range(0, len(groups), step))
+        elif extension == ".csv":
+            size = os.path.getsize(path)
+            step = max(1, -(-size // parts))
+            tasks.extend(("csv", path, (i, min(i + step, size))) for i in range(0, size, step))
+        else:
+            tasks.append(("excel", path, None))
+
+    return tasks
+
+
+def aggregate_partition(task, chunk_rows=CHUNK_ROWS, dimensions=DIMENSIONS):
+    kind, path, argument = task
+    columns = needed_columns(dimensions)
+    if kind == "excel":
+        from snapshot import read_source
+        return StatsCube(read_source(path), dimensions)
+
+    if kind == "parquet":
+        chunks = iter_parquet(path, chunk_rows, columns, argument)
+    else:
+        chunks = iter_csv_range(path, argument[0], argument[1], chunk_rows, columns)
+    accumulator = CubeAccumulator(dimensions)
+    for chunk, fraction in chunks:
+        accumulator.add(chunk)
+
+    return accumulator.cube
+
+
+def parallel_cube(path, workers=None, chunk_rows=CHUNK_ROWS, progress=None, dimensions=DIMENSIONS):
+    # each worker process returns the small per-cell sums of its partition,
+    # which are merged exactly in this process
+    workers = workers or os.cpu_count() or 1
+    tasks = partitions(expand_sources(path), workers)
+    cubes = []
+    rows = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [pool.submit(aggregate_partition, task, chunk_rows, dimensions) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            cube = future.result()
+            if cube is not None:
+                cubes.append(cube)
+                rows += int(cube.rows.sum())
+            if progress is not None:
+                progress(rows, done / len(tasks))
+
+    if not cubes:
+        raise ValueError("no rows were read from {0}".format(path))
+
+    return StatsCube.merge(cubes)
@@ -1,503 +1,139 @@
+import startup
 import sys
-import pandas as pd
-from PyQt5.QtWidgets import QMainWindow, QApplication, QWidget, QFormLayout, QGridLayout, QVBoxLayout, QHBoxLayout, QGroupBox, QLabel, QCheckBox, QTextBrowser
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
-import matplotlib
-import matplotlib.ticker as mticker
-import numpy as np
-
-class ToolWindow(QMainWindow):
-
-    def __init__(self):
-        super(ToolWindow, self).__init__()
-        self.title = 'Classification LLC X PAD X Diabetes'
-        self.width = 1300
-        self.height = 950
-        self.setWindowTitle(self.title)
-        self.setGeometry(0, 0, self.width, self.height)
-        self.setCentralWidget(ClassificationTool())
-        self.setStyleSheet(
-            '''
-                QMainWindow {background-color: #fff}
-                QGroupBox {font-weight: bold; font-size: 12pt; color: #333}
-            '''
-        )
-        self.show()
-
-
-class ClassificationTool(QWidget):
-
-    def __init__(self):
-        super(ClassificationTool, self).__init__()
-
-        self.toolLayout = QGridLayout()
-        self.setLayout(self.toolLayout)
-
-        self.llc_options = {
-            "1. Gangrene": [self.llc1Checked, 0],
-            "2. Osteomyelitis, Foot": [self.llc2Checked, 0],
-            "3. Skin Ulcer, Foot": [self.llc3Checked, 0],
-            "4. Osteomyelitis, Lower Limb": [self.llc4Checked, 0],
-            "5. Skin Ulcer, Lower Limb": [self.llc5Checked, 0],
-            "6. Cellulitis, Lower Limb": [self.llc6Checked, 0],
-            "7. Cellulitis, Toe": [self.llc7Checked, 0]
-        }
-        self.pad_options = {
-            "PAD": [self.pad1Checked, 0], 
-            "WO PAD": [self.pad2Checked, 0]
-        }
-        self.diabetes_options = {
-            "Diabetes": [self.diabetes1Checked, 0],  
-            "WO Diabetes": [self.diabetes2Checked, 0], 
-            "WO Diabetes, Gangrene NEC": [self.diabetes3Checked, 0]
-        }
-
-        self.dataImport = self.getSourceData(path="llc_pad_diabetes_w_amps_10yrs.xlsx")
-
-        self.resultsStats = {
-            # IP & DS
-            'discharges_and_ds': 0,	
-            'alos': 0,
-            'discharges_and_ds_per_pat': 0,
-            'unique_patients_ip_ds': 0,
-            'major_during': 0,	
-            'minor_during':	0,
-            'lpr_during': 0,	
-            'major_1yr': 0,
-            'minor_1yr': 0,
-            'lpr_1yr': 0,
-            'major_3yr': 0,	
-            'minor_3yr': 0,
-            'lpr_3yr': 0,	
-            'major_5yr': 0,	
-            'minor_5yr': 0,
-            'lpr_5yr': 0,
-
-            # ED
-            'ed_v':	0,
-            'unique_patients_ed': 0,
-            'ed_visits_per_pat': 0,
-            'major_amp_1yr': 0,
-            'minor_amp_1yr': 0,
-            'lower_pr_1yr': 0,
-            'major_amp_3yr': 0,
-            'minor_amp_3yr': 0,
-            'lower_pr_3yr': 0,	
-            'major_amp_5yr': 0,	
-            'minor_amp_5yr': 0,
-            'lower_pr_5yr': 0
-        }
-
-        self.toolLayout.addWidget(self.createOptions("LLC"), 0, 0)
-        self.toolLayout.addWidget(self.createOptions("PAD"), 0, 1)
-        self.toolLayout.addWidget(self.createOptions("Diabetes"), 0, 2)
-
-        resultsBox = self.createOutputBox("Results")
-        self.resultsLayout = QHBoxLayout()
-        resultsBox.setLayout(self.resultsLayout)
-
-        self.creatInfoCard()
-
-        self.canvas = FigureCanvas(plt.Figure(figsize=(5, 7), dpi=200, tight_layout=True))
-        self.resultsLayout.addWidget(self.canvas)
-        self.insert_ax()
-
-        self.toolLayout.addWidget(resultsBox, 1, 0, 2, 3)
-
-    def getSourceData(self, path):
-        df = pd.read_excel(path, sheet_name="srcdata")
-
-        return df
-
-    # creat form method
-
-    def createOptions(self, opt_name):
-        
-        inputGroupBox = QGroupBox(opt_name)
-        inputGroupBox.setFont(QFont('Open Sans', 10))
-        inputLayout = QFormLayout()
-        for opt in self.llc_options:
-            b = QCheckBox(opt)
-            b.setChecked(False)
-            b.stateChanged.connect(self.llc_options[opt][0])
-            b.stateChanged.connect(self.update_chart)
-            inputLayout.addRow(b)
-
-        inputGroupBox.setLayout(inputLayout)
-
-        return inputGroupBox
-
-    def createOutputBox(self, group_name):
-
-        outputGroupBox = QGroupBox(group_name)
-        outputGroupBox.setFont(QFont('Open Sans', 10))
-
-        return outputGroupBox
-
-    def infoText(self):
-        return '''
-                <span style=font-size:10pt> <em>Inpatient & Day Surgery</em> </span><br><br>
-                Discherges & Day Surgeries: <span style=color:#b22222>{0[discharges_and_ds]:0.0f}</span> <br>
-                ALOS: <span style=color:#b22222>{0[alos]:0.0f}</span> <br>
-                Unique Patients: <span style=color:#b22222>{0[unique_patients_ip_ds]:0.0f}</span> <br>
-                Discharges or Day Surgeries per Patient: <span style=color:#b22222>{0[discharges_and_ds_per_pat]:0.1f}</span> <br><br><br><br>
-
-                <span style=font-size:10pt> <em>ED</em> </span><br><br>
-                ED Visits: <span style=color:#b22222>{0[ed_v]:0.0f}</span> <br>
-                Unique ED Patients: <span style=color:#b22222>{0[unique_patients_ed]:0.0f}</span> <br>
-                ED Visits per Patient: <span style=color:#b22222>{0[ed_visits_per_pat]:0.1f}</span> <br><br>
-            '''.format(self.resultsStats)
-
-    def creatInfoCard(self):
-        self.displayStats = QLabel()
-        self.displayStats.setFont(QFont("Open Sans", 10))
-        self.displayStats.setAlignment(Qt.AlignTop)	
-        self.displayStats.setText(self.infoText())
-
-        self.resultsLayout.addWidget(self.displayStats)
-
-    def updateInfoCard(self):
-        self.displayStats.setText(self.infoText())
-
-    def diabetes1Checked(self, checked):
-
-        if checked:
-            self.diabetes_options["Diabetes"][1] = 1
-        else:
-            self.diabetes_options["Diabetes"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def diabetes2Checked(self, checked):
-
-        if checked:
-            self.diabetes_options["WO Diabetes"][1] = 1
-        else:
-            self.diabetes_options["WO Diabetes"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def diabetes3Checked(self, checked):
-
-        if checked:
-            self.diabetes_options["WO Diabetes, Gangrene NEC"][1] = 1
-        else:
-            self.diabetes_options["WO Diabetes, Gangrene NEC"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def pad1Checked(self, checked):
-
-        if checked:
-            self.pad_options["PAD"][1] = 1
-        else:
-            self.pad_options["PAD"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def pad2Checked(self, checked):
-
-        if checked:
-            self.pad_options["WO PAD"][1] = 1
-        else:
-            self.pad_options["WO PAD"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def llc1Checked(self, checked):
-
-        if checked:
-            self.llc_options["1. Gangrene"][1] = 1
-        else:
-            self.llc_options["1. Gangrene"][1] = 0
-
-        self.dfFilterAndAgg()
-
-    def llc2Checked(self, checked):
-
-        if checked:
-            self.llc_options["2. Osteomyelitis, Foot"][1] = 1
-        else:
-            self.llc_options["2. Osteomyelitis, Foot"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def llc3Checked(self, checked):
-
-        if checked:
-            self.llc_options["3. Skin Ulcer, Foot"][1] = 1
-        else:
-            self.llc_options["3. Skin Ulcer, Foot"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def llc4Checked(self, checked):
-
-        if checked:
-            self.llc_options["4. Osteomyelitis, Lower Limb"][1] = 1
+import argparse
+import multiprocessing
+from ingest import CHUNK_ROWS
+from core import DEFAULT_SOURCE, StatsEngine, load_engine, compute_stats
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Classification LLC X PAD X Diabetes")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="source data: the .xlsx workbook, or .csv/.parquet extracts (a path or glob pattern) that are streamed in chunks")
+    parser.add_argument("--dimensions", nargs="+", metavar="COLUMN", help="grouping columns offered as option groups, e.g. psg_llc psg_pad psg_diabetes year (default: the three classifications)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk when streaming a .csv/.parquet source")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to pre-aggregate .csv/.parquet sources (0: one per core)")
+    parser.add_argument("--rebuild-cache", action="store_true", help="re-read the workbook and rebuild its columnar snapshot")
+    parser.add_argument("--cache-check", choices=["stat", "hash"], default="stat", help="validate the snapshot by file mtime/size or by content hash")
+    parser.add_argument("--batch", metavar="SELECTIONS", help="compute stats without the GUI for a CSV of selections (columns llc, pad, diabetes; several options joined by '|') or 'all' for every combination")
+    parser.add_argument("--memory-report", action="store_true", help="print the memory used by the parsed workbook and by the compact dataset (for .csv/.parquet sources: per chunk and by the cube), then exit")
+    parser.add_argument("--profile", nargs="?", const=True, metavar="TRACE", help="time the load, aggregate and draw stages (Ctrl+Shift+P shows them); with TRACE, write a Chrome trace file on exit (also enabled by LLC_PAD_PROFILE)")
+    parser.add_argument("--result-cache", metavar="PATH", help="SQLite file of computed results shared between sessions and users (default: next to the data; 'off' to disable)")
+    parser.add_argument("--precompute-cache", metavar="SELECTIONS", help="fill the result cache for a CSV of selections (as for --batch) or 'all', then exit")
+    parser.add_argument("--startup-report", action="store_true", help="print the time to first paint, chart and results, then exit")
+    parser.add_argument("--out", default="-", help="batch output, .csv or .parquet (default: CSV on stdout)")
+    parser.add_argument("--export", metavar="PATH", help="render the probability charts without the GUI: a directory of PNGs or a multi-page .pdf")
+    parser.add_argument("--selections", default="all", help="cohorts to export: a CSV of selections as for --batch, or 'all' (default)")
+    parser.add_argument("--render-workers", type=int, default=0, help="processes rendering PNG exports (0: one per core)")
+    parser.add_argument("--serve", metavar="PORT", type=int, help="answer GET /stats and /chart.png over HTTP on localhost instead of opening the GUI")
+    parser.add_argument("--host", default="127.0.0.1", help="interface the HTTP service listens on")
+
+    return parser.parse_known_args(argv)
+
+
+def print_progress(rows, fraction):
+    print("\rread {0:,} rows ({1:.0%})".format(rows, fraction), end="", file=sys.stderr, flush=True)
+    if fraction >= 1:
+        print(file=sys.stderr)
+
+
+def print_export_progress(charts, fraction):
+    print("\rrendered {0:,} charts ({1:.0%})".format(charts, fraction), end="", file=sys.stderr, flush=True)
+    if fraction >= 1:
+        print(file=sys.stderr)
+
+
+def open_result_cache(args):
+    from resultcache import ResultCache, default_path
+
+    path = default_path(args.source) if args.result_cache is None else args.result_cache
+    return None if path in (None, "off") else ResultCache(path)
+
+
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    args, qt_args = parse_args(argv[1:])
+    load_options = {"rebuild": args.rebuild_cache, "check": args.cache_check, "chunk_rows": args.chunk_rows, "workers": args.workers or None, "dimensions": args.dimensions}
+
+    if args.memory_report:
+        from ingest import is_streamed, stream_memory_report
+        from snapshot import memory_report
+        if is_streamed(args.source):
+            from cube import DIMENSIONS
+            report = stream_memory_report(args.source, args.chunk_rows, args.dimensions or DIMENSIONS)
         else:
-            self.llc_options["4. Osteomyelitis, Lower Limb"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def llc5Checked(self, checked):
-
-        if checked:
-            self.llc_options["5. Skin Ulcer, Lower Limb"][1] = 1
-        else:
-            self.llc_options["5. Skin Ulcer, Lower Limb"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def llc6Checked(self, checked):
-
-        if checked:
-            self.llc_options["6. Cellulitis, Lower Limb"][1] = 1
-        else:
-            self.llc_options["6. Cellulitis, Lower Limb"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def llc7Checked(self, checked):
-
-        if checked:
-            self.llc_options["7. Cellulitis, Toe"][1] = 1
-        else:
-            self.llc_options["7. Cellulitis, Toe"][1] = 0
-        
-        self.dfFilterAndAgg()
-
-    def dfFilterAndAgg(self):
-
-        llc = []
-        pad = []
-        diabetes = []
-
-        for opt in self.llc_options:
-            if self.llc_options[opt][1] == 1:
-                llc.append(opt)
-
-        for opt in self.pad_options:
-            if self.pad_options[opt][1] == 1:
-                pad.append(opt)
-
-        for opt in self.diabetes_options:
-            if self.diabetes_options[opt][1] == 1:
-                diabetes.append(opt)
-
-        df = self.dataImport.copy()
-
-        if len(llc) > 0:
-            df = df.loc[df["psg_llc"].isin(llc)]
-        if len(pad) > 0:
-            df = df.loc[df["psg_pad"].isin(pad)]
-        if len(diabetes) > 0:
-            df = df.loc[df["psg_diabetes"].isin(diabetes)]
-        if len(llc) == 0 and len(pad) == 0 and len(diabetes) == 0:
-            df = df.loc[df["psg_llc"].isin(llc) & df["psg_pad"].isin(pad) & df["psg_diabetes"].isin(diabetes)]
-
-        if df.shape[0] == 0:
-            self.resultsStats = dict.fromkeys(self.resultsStats, 0)
-        else:
-            self.resultsStats['discharges_and_ds'] = df['discharges_and_ds'].sum()
-            self.resultsStats['alos'] = df['days'].sum()/df['discharges'].sum()
-            self.resultsStats['ed_v'] = df['ed_v'].sum()
-            self.resultsStats['discharges_and_ds_per_pat'] = df['discharges_and_ds'].sum()/df['unique_patients_ip_ds'].sum()  
-            self.resultsStats['ed_visits_per_pat'] = df['ed_v'].sum()/df['unique_patients_ed'].sum()
-
-            if df.loc[df['hin_flag'] == 'Unique HIN'].shape[0] == 0:
-                self.resultsStats['unique_patients_ip_ds'] = 0
-                self.resultsStats['unique_patients_ed'] = 0
-            else:
-                self.resultsStats['unique_patients_ip_ds'] = df.loc[df['hin_flag'] == 'Unique HIN', 'unique_patients_ip_ds'].sum()
-                self.resultsStats['unique_patients_ed'] = df.loc[df['hin_flag'] == 'Unique HIN', 'unique_patients_ed'].sum()
-            
-            if df['discharges_and_ds'].sum() > 0:
-                self.resultsStats['major_during'] = df['major_during'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['minor_during'] = df['minor_during'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['lpr_during'] = df['lpr_during'].sum()/df['discharges_and_ds'].sum()
-
-            if df['discharges_and_ds'].sum() > 0:
-                self.resultsStats['major_1yr'] = df['major_1yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['minor_1yr'] = df['minor_1yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['lpr_1yr'] = df['lpr_1yr'].sum()/df['discharges_and_ds'].sum()
-
-            if df['discharges_and_ds'].sum() > 0:
-                self.resultsStats['major_3yr'] = df['major_3yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['minor_3yr'] = df['minor_3yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['lpr_3yr'] = df['lpr_3yr'].sum()/df['discharges_and_ds'].sum()
-
-            if df['discharges_and_ds'].sum() > 0:
-                self.resultsStats['major_5yr'] = df['major_5yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['minor_5yr'] = df['minor_5yr'].sum()/df['discharges_and_ds'].sum()
-                self.resultsStats['lpr_5yr'] = df['lpr_5yr'].sum()/df['discharges_and_ds'].sum()
-
-            if df['ed_v'].sum() > 0:
-                self.resultsStats['major_amp_1yr'] = df['major_amp_1yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['minor_amp_1yr'] = df['minor_amp_1yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['lower_pr_1yr'] = df['lower_pr_1yr'].sum()/df['ed_v'].sum() 
-
-            if df['ed_v'].sum()  > 0:
-                self.resultsStats['major_amp_3yr'] = df['major_amp_3yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['minor_amp_3yr'] = df['minor_amp_3yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['lower_pr_3yr'] = df['lower_pr_3yr'].sum()/df['ed_v'].sum() 
-
-            if df['ed_v'].sum() > 0:
-                self.resultsStats['major_amp_5yr'] = df['major_amp_5yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['minor_amp_5yr'] = df['minor_amp_5yr'].sum()/df['ed_v'].sum() 
-                self.resultsStats['lower_pr_5yr'] = df['lower_pr_5yr'].sum()/df['ed_v'].sum()        
-
-        self.updateInfoCard()
-
-    def insert_ax(self):
-        font = {
-            'weight': 'normal',
-            'size': 4.5
-        }
-        matplotlib.rc('font', **font)
-
-        self.bar_colors = {
-            'during':'#8dd3c7', 
-            '1yripds': '#3182bd', '1yred': '#f03b20', 
-            '3yripds': '#9ecae1', '3yred': '#feb24c', 
-            '5yripds': '#deebf7', '5yred': '#ffeda0'
-        }
-
-        self.ax = self.canvas.figure.subplots(nrows=2, ncols=2) 
-
-        self.ax[0,0].set_ylim([0, 1])
-        ticks_loc = self.ax[0,0].get_yticks().tolist()
-        self.ax[0,0].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[0,0].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[0,0].set_ylabel("Probability of Procedure")
-        self.ax[0,0].set_title('Probability of Procedure during Discharge')
-
-        self.ax[0,1].set_ylim([0, 1])
-        ticks_loc = self.ax[0,1].get_yticks().tolist()
-        self.ax[0,1].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[0,1].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[0,1].set_ylabel("Probability of Procedure")
-        self.ax[0,1].set_title('Probability of Procedure Within 1YR')
-
-        self.ax[1,0].set_ylim([0, 1])
-        ticks_loc = self.ax[1,0].get_yticks().tolist()
-        self.ax[1,0].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[1,0].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[1,0].set_ylabel("Probability of Procedure")
-        self.ax[1,0].set_title('Probability of Procedure Within 3YRS')
-
-        self.ax[1,1].set_ylim([0, 1])
-        ticks_loc = self.ax[1,1].get_yticks().tolist()
-        self.ax[1,1].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[1,1].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[1,1].set_ylabel("Probability of Procedure")
-        self.ax[1,1].set_title('Probability of Procedure Within 5YRS')
-
-        labels = ['Major\nAmputation', 'Minor\nAmputation', 'Lower\nPeripheral\nRevascularization']
-
-        self.bar1 = self.ax[0,0].bar(labels, [0, 0, 0], color=self.bar_colors['during'])
-
-        self.bar2_1 = self.ax[0,1].bar(labels, [0, 0, 0], color=self.bar_colors['1yripds']) 
-        self.bar2_2 = self.ax[0,1].bar(labels, [0, 0, 0], color=self.bar_colors['1yred']) 
-
-        self.bar3_1 = self.ax[1,0].bar(labels, [0, 0, 0], color=self.bar_colors['3yripds']) 
-        self.bar3_2 = self.ax[1,0].bar(labels, [0, 0, 0], color=self.bar_colors['3yred'])  
-
-        self.bar4_1 = self.ax[1,1].bar(labels, [0, 0, 0], color=self.bar_colors['5yripds'])  
-        self.bar4_2 = self.ax[1,1].bar(labels, [0, 0, 0], color=self.bar_colors['5yred'])  
-
-        self.canvas.draw()
-        self.bar1 = None
-        self.bar2_1 = None
-        self.bar2_2 = None
-        self.bar3_1 = None
-        self.bar3_2 = None
-        self.bar4_1 = None
-        self.bar4_2 = None
-
-    def update_chart(self):
-
-        labels = ['Major\nAmputation', 'Minor\nAmputation', 'Lower\nPeripheral\nRevascularization']
-
-        if self.bar1:
-            self.bar1.remove()
-            self.ax[0,0].cla()
-        
-        if self.bar2_1 and self.bar2_2:
-            self.bar2_1.remove()
-            self.bar2_2.remove()
-            self.ax[0,1].cla()
-        
-        if self.bar3_1 and self.bar3_2:
-            self.bar3_1.remove()
-            self.bar3_2.remove()
-            self.ax[1,0].cla()
-
-        if self.bar4_1 and self.bar4_2:
-            self.bar4_1.remove()
-            self.bar4_2.remove()
-            self.ax[1,1].cla()
-
-        self.ax[0,0].set_title('Probability of Procedure During Discharge')
-        self.ax[0,0].set_ylim([0, 1])
-        ticks_loc = self.ax[0,0].get_yticks().tolist()
-        self.ax[0,0].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[0,0].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[0,0].set_ylabel("Probability of Procedure")
-        self.bar1 = self.ax[0,0].bar(labels, [self.resultsStats['major_during'], self.resultsStats['minor_during'], self.resultsStats['lpr_during']], color=self.bar_colors['during'])
-        self.ax[0,0].bar_label(container=self.bar1, labels=["{0[major_during]:.0%}".format(self.resultsStats), "{0[minor_during]:.0%}".format(self.resultsStats), "{0[lpr_during]:.0%}".format(self.resultsStats)], padding=3)
-
-        x = np.arange(len(labels))
-        width = 0.35
-
-        self.ax[0,1].set_title('Probability of Procedure Within 1YR')
-        self.ax[0,1].set_ylim([0, 1])
-        ticks_loc = self.ax[0,1].get_yticks().tolist()
-        self.ax[0,1].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[0,1].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[0,1].set_ylabel("Probability of Procedure")
-        self.bar2_1 = self.ax[0,1].bar(x-width/2, [self.resultsStats['major_1yr'], self.resultsStats['minor_1yr'], self.resultsStats['lpr_1yr']], color=self.bar_colors['1yripds'], label='IP & Day Surgery', width=width)
-        self.bar2_2 = self.ax[0,1].bar(x+width/2, [self.resultsStats['major_amp_1yr'], self.resultsStats['minor_amp_1yr'], self.resultsStats['lower_pr_1yr']], color='#b22222', label='ED', width=width)
-        self.ax[0,1].set_xticks(x)
-        self.ax[0,1].set_xticklabels(labels)
-        self.ax[0,1].legend()
-        self.ax[0,1].bar_label(container=self.bar2_1, labels=["{0[major_1yr]:.0%}".format(self.resultsStats), "{0[minor_1yr]:.0%}".format(self.resultsStats), "{0[lpr_1yr]:.0%}".format(self.resultsStats)], padding=3)
-        self.ax[0,1].bar_label(container=self.bar2_2, labels=["{0[major_amp_1yr]:.0%}".format(self.resultsStats), "{0[minor_amp_1yr]:.0%}".format(self.resultsStats), "{0[lower_pr_1yr]:.0%}".format(self.resultsStats)], padding=3)
-
-        self.ax[1,0].set_title('Probability of Procedure Within 3YRS')
-        self.ax[1,0].set_ylim([0, 1])
-        ticks_loc = self.ax[1,0].get_yticks().tolist()
-        self.ax[1,0].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[1,0].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[1,0].set_ylabel("Probability of Procedure")
-        self.bar3_1 = self.ax[1,0].bar(x-width/2, [self.resultsStats['major_3yr'], self.resultsStats['minor_3yr'], self.resultsStats['lpr_3yr']], color=self.bar_colors['3yripds'], label='IP & Day Surgery', width=width)
-        self.bar3_2 = self.ax[1,0].bar(x+width/2, [self.resultsStats['major_amp_3yr'], self.resultsStats['minor_amp_3yr'], self.resultsStats['lower_pr_3yr']], color=self.bar_colors['3yred'], label='ED', width=width)
-        self.ax[1,0].set_xticks(x)
-        self.ax[1,0].set_xticklabels(labels)
-        self.ax[1,0].legend()
-        self.ax[1,0].bar_label(container=self.bar3_1, labels=["{0[major_3yr]:.0%}".format(self.resultsStats), "{0[minor_3yr]:.0%}".format(self.resultsStats), "{0[lpr_3yr]:.0%}".format(self.resultsStats)], padding=3)
-        self.ax[1,0].bar_label(container=self.bar3_2, labels=["{0[major_amp_3yr]:.0%}".format(self.resultsStats), "{0[minor_amp_3yr]:.0%}".format(self.resultsStats), "{0[lower_pr_3yr]:.0%}".format(self.resultsStats)], padding=3)
+            report = memory_report(args.source)
+        for key, value in report.items():
+            print("{0}: {1}".format(key, value))
+        return 0
+
+    if args.batch:
+        from batch import run_batch
+        engine = load_engine(args.source, progress=print_progress, **load_options)
+        try:
+            run_batch(engine, args.batch, args.out)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        return 0
+
+    if args.export:
+        from export import run_export
+        engine = load_engine(args.source, progress=print_progress, **load_options)
+        try:
+            count = run_export(engine, args.selections, args.export, args.render_workers or None, progress=print_export_progress)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print("wrote {0} charts to {1}".format(count, args.export), file=sys.stderr)
+        return 0
+
+    if args.precompute_cache:
+        from batch import read_selections
+        from resultcache import precompute
+        cache = open_result_cache(args)
+        if cache is None:
+            raise SystemExit("--precompute-cache needs a --result-cache path")
+        engine = load_engine(args.source, progress=print_progress, **load_options)
+        if engine.dataset_key is None:
+            raise SystemExit("{0} changed while it was read; run --precompute-cache again".format(args.source))
+        selections = engine.all_selections() if args.precompute_cache == "all" else read_selections(args.precompute_cache, engine.fields, engine.validate)
+        try:
+            count = precompute(engine, cache, selections)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print("cached {0} selections in {1}".format(count, cache.path), file=sys.stderr)
+        return 0
+
+    if args.serve is not None:
+        from server import serve
+        engine = load_engine(args.source, progress=print_progress, **load_options)
+        serve(engine, args.host, args.serve, results=open_result_cache(args))
+        return 0
+
+    from profiling import profiler
+    if args.profile:
+        profiler.enable(None if args.profile is True else args.profile)
+    if profiler.trace_path:
+        import atexit
+        atexit.register(profiler.dump)
+
+    # Qt and matplotlib are only imported once a window is needed
+    from PyQt5.QtWidgets import QApplication
+    from gui import ToolWindow
+
+    startup.mark("imports")
+    app = QApplication(argv[:1] + qt_args)
+    if args.startup_report:
+        startup.when("first results", lambda: (print(startup.report(), file=sys.stderr), app.quit()))
+    result_cache = open_result_cache(args)
+    tool = ToolWindow(source=args.source, load_options=load_options, result_cache=result_cache)
+
+    status = app.exec_()
+    if result_cache is not None:
+        result_cache.close()
+    return status
 
-        self.ax[1,1].set_title('Probability of Procedure Within 5YRS')
-        self.ax[1,1].set_ylim([0, 1])
-        ticks_loc = self.ax[1,1].get_yticks().tolist()
-        self.ax[1,1].yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-        self.ax[1,1].set_yticklabels(['{:,.0%}'.format(x) for x in ticks_loc])
-        self.ax[1,1].set_ylabel("Probability of Procedure")
-        self.bar4_1 = self.ax[1,1].bar(x-width/2, [self.resultsStats['major_5yr'], self.resultsStats['minor_5yr'], self.resultsStats['lpr_5yr']], color=self.bar_colors['5yripds'], label='IP & Day Surgery', width=width)
-        self.bar4_2 = self.ax[1,1].bar(x+width/2, [self.resultsStats['major_amp_5yr'], self.resultsStats['minor_amp_5yr'], self.resultsStats['lower_pr_5yr']], color=self.bar_colors['5yred'], label='ED', width=width)
-        self.ax[1,1].set_xticks(x)
-        self.ax[1,1].set_xticklabels(labels)
-        self.ax[1,1].legend()
-        self.ax[1,1].bar_label(container=self.bar4_1, labels=["{0[major_5yr]:.0%}".format(self.resultsStats), "{0[minor_5yr]:.0%}".format(self.resultsStats), "{0[lpr_5yr]:.0%}".format(self.resultsStats)], padding=3)
-        self.ax[1,1].bar_label(container=self.bar4_2, labels=["{0[major_amp_5yr]:.0%}".format(self.resultsStats), "{0[minor_amp_5yr]:.0%}".format(self.resultsStats), "{0[lower_pr_5yr]:.0%}".format(self.resultsStats)], padding=3)
-        
-        self.canvas.draw()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    tool = ToolWindow()
-    sys.exit(app.exec_())
+    # in a frozen build, worker processes (parallel ingest, PNG export) start
+    # the executable again; this hands them to multiprocessing instead of main()
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# -*- mode: python ; coding: utf-8 -*-
+# pyinstaller llc_pad_diabetes.spec  (run from the llc_pad_diabetes folder)
+#
+# one-folder build: a one-file build unpacks the whole bundle to a temp
+# directory on every launch, which costs more than the app's own start-up
+
+block_cipher = None
+
+EXCLUDES = [
+    # matplotlib backends the tool never uses (Qt5Agg for the window, Agg/PDF for exports)
+    'matplotlib.backends.backend_tkagg', 'matplotlib.backends.backend_tkcairo', 'matplotlib.backends._backend_tk',
+    'matplotlib.backends.backend_gtk3agg', 'matplotlib.backends.backend_gtk3cairo',
+    'matplotlib.backends.backend_gtk4agg', 'matplotlib.backends.backend_gtk4cairo',
+    'matplotlib.backends.backend_wx', 'matplotlib.backends.backend_wxagg', 'matplotlib.backends.backend_wxcairo',
+    'matplotlib.backends.backend_macosx', 'matplotlib.backends.backend_webagg', 'matplotlib.backends.backend_webagg_core',
+    'matplotlib.backends.backend_nbagg', 'matplotlib.backends.backend_cairo', 'matplotlib.backends.backend_pgf',
+    'matplotlib.backends.backend_qt5cairo', 'matplotlib.backends.backend_qtcairo',
+    'tkinter', '_tkinter', 'wx', 'gi', 'cairo', 'PySide2', 'PySide6', 'PyQt6',
+    # Qt modules nothing imports
+    'PyQt5.QtWebEngine', 'PyQt5.QtWebEngineCore', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtQml', 'PyQt5.QtQuick',
+    'PyQt5.QtMultimedia', 'PyQt5.QtBluetooth', 'PyQt5.QtSql', 'PyQt5.QtTest', 'PyQt5.QtDesigner', 'PyQt5.QtNetwork',
+    # pandas optional engines and their dependencies; only openpyxl is needed for the workbook
+    'scipy', 'numba', 'numexpr', 'bottleneck', 'tables', 'sqlalchemy', 'xlrd', 'pyxlsb', 'odf', 'lxml', 'bs4', 'html5lib',
+    'jinja2', 'fsspec', 'gcsfs', 's3fs', 'botocore',
+    # .parquet sources are for the command line; drop this line to bundle pyarrow
+    'pyarrow',
+    # development tooling
+    'IPython', 'jupyter_client', 'ipykernel', 'notebook', 'pytest', 'sphinx', 'docutils',
+    'pandas.tests', 'numpy.tests', 'matplotlib.tests', 'PIL.ImageTk', 'PIL.ImageQt'
+]
+
+a = Analysis(
+    ['llc_pad_diabetes.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    # imported by name at run time rather than by an import statement
+    hiddenimports=['openpyxl', 'matplotlib.backends.backend_qt5agg', 'matplotlib.backends.backend_agg'],
+    hookspath=[],
+    runtime_hooks=[],
+    excludes=EXCLUDES,
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False
+)
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='llc_pad_diabetes',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    # UPX-compressed libraries are decompressed on every launch
+    upx=False,
+    console=False
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    name='llc_pad_diabetes'
+)
@@ -0,0 +1,134 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+ENV_VAR = "LLC_PAD_PROFILE"
+WINDOW = 500
+MAX_EVENTS = 100000
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def parse_env(value):
+    # LLC_PAD_PROFILE: unset, empty, 0, false, no or off -> (False, None);
+    # 1, true, yes or on -> (True, None); anything else is a trace file path
+    value = (value or "").strip()
+    if value.lower() in ("", "0", "false", "no", "off"):
+        return False, None
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True, None
+
+    return True, value
+
+
+class Profiler:
+    # opt-in spans around the load, aggregate and draw stages. Nothing is
+    # wrapped unless profiling is enabled, so the disabled cost is a flag check
+    # where the wrappers are installed. While enabled, tracemalloc traces every
+    # allocation (which slows them): a span records its net traced bytes and
+    # its peak above the start, so memory allocated and freed within the span
+    # shows in the peak. Tracing is process-wide, so a span that overlaps work
+    # on another thread also sees that thread's allocations; the peak is only
+    # reset when no other span is running.
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = False
+        self.trace_path = None
+        self.samples = {}
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.window = window
+        self.lock = threading.Lock()
+        self.active = 0
+        self.origin = time.perf_counter()
+        if enabled:
+            self.enable()
+
+    def enable(self, trace_path=None):
+        self.enabled = True
+        if trace_path:
+            self.trace_path = trace_path
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, name, start, seconds, net_bytes, peak_bytes):
+        event = {
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": (start - self.origin) * 1e6, "dur": seconds * 1e6,
+            "args": {"net_bytes": net_bytes, "peak_bytes": peak_bytes}
+        }
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append((seconds, net_bytes, peak_bytes))
+            self.events.append(event)
+
+    def wrap(self, name, fn):
+        if not self.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                if not self.active:
+                    tracemalloc.reset_peak()
+                self.active += 1
+            before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                current, peak = tracemalloc.get_traced_memory()
+                with self.lock:
+                    self.active -= 1
+                self.record(name, start, seconds, current - before, max(peak - before, 0))
+
+        return wrapper
+
+    def summary(self):
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+
+        report = {}
+        for name, values in samples.items():
+            times = sorted(v[0] * 1000 for v in values)
+            report[name] = {
+                "n": len(times),
+                "p50_ms": percentile(times, 50),
+                "p95_ms": percentile(times, 95),
+                "max_ms": times[-1],
+                "net_kib_p50": percentile(sorted(v[1] / 1024 for v in values), 50),
+                "peak_kib_p50": percentile(sorted(v[2] / 1024 for v in values), 50)
+            }
+
+        return report
+
+    def summary_text(self):
+        lines = ["{0:<16} {1:>6} {2:>9} {3:>9} {4:>9} {5:>12} {6:>13}".format(
+            "span", "n", "p50 ms", "p95 ms", "max ms", "net KiB p50", "peak KiB p50"
+        )]
+        for name, s in sorted(self.summary().items()):
+            lines.append("{0:<16} {1:>6} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>+12.1f} {6:>13.1f}".format(
+                name, s["n"], s["p50_ms"], s["p95_ms"], s["max_ms"], s["net_kib_p50"], s["peak_kib_p50"]
+            ))
+
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        # Chrome trace event format: chrome://tracing, Perfetto or speedscope
+        path = path or self.trace_path
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        return path
+
+
+_enabled, _trace_path = parse_env(os.environ.get(ENV_VAR))
+profiler = Profiler(enabled=_enabled)
+profiler.trace_path = _trace_path
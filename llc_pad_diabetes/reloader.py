@@ -0,0 +1,97 @@
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+from core import load_engine
+from snapshot import fingerprint
+
+SETTLE_MS = 1500
+
+
+class SourceReloader(QObject):
+    # loads the source on a background thread, then watches it and reloads
+    # once writes have settled; each new engine is handed to the GUI thread
+    # through a queued signal, the old one keeps serving until then
+
+    reloaded = pyqtSignal(object, float)
+    reloadFailed = pyqtSignal(str)
+    loaderFinished = pyqtSignal(object)
+
+    def __init__(self, path, load=load_engine, watch=True, settle=SETTLE_MS, parent=None):
+        super(SourceReloader, self).__init__(parent)
+        self.path = path
+        self.loadSource = load
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reload")
+        self.inFlight = False
+        self.pending = False
+        self.loaded = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(settle)
+        self.timer.timeout.connect(self.reload)
+        self.loaderFinished.connect(self.deliver)
+
+        self.watcher = None
+        if watch:
+            # the directory is watched too: a refresh that replaces the file
+            # (write to a temp name, then rename) drops it from the file watch
+            self.watcher = QFileSystemWatcher(self)
+            self.watcher.addPath(os.path.dirname(os.path.abspath(self.path)))
+            self.watch()
+            self.watcher.fileChanged.connect(self.changed)
+            self.watcher.directoryChanged.connect(self.changed)
+
+    def current(self):
+        try:
+            return fingerprint(self.path)
+        except OSError:
+            return None
+
+    def watch(self):
+        if os.path.abspath(self.path) not in self.watcher.files() and os.path.exists(self.path):
+            self.watcher.addPath(os.path.abspath(self.path))
+
+    def changed(self, path=None):
+        self.watch()
+        # restarted on every event, so a file still being written is not read
+        self.timer.start()
+
+    def reload(self, force=False):
+        # force is the initial load, and the only one for sources that are
+        # not watched (glob patterns)
+        fp = self.current()
+        if not force and (fp is None or fp == self.loaded):
+            return
+        if self.inFlight:
+            self.pending = True
+            return
+
+        self.inFlight = True
+        future = self.executor.submit(self.load, fp)
+        future.add_done_callback(self.loaderFinished.emit)
+
+    def load(self, fp):
+        start = time.perf_counter()
+        engine = self.loadSource(self.path)
+
+        return fp, engine, time.perf_counter() - start
+
+    def deliver(self, future):
+        self.inFlight = False
+        if future.exception() is not None:
+            traceback.print_exception(type(future.exception()), future.exception(), future.exception().__traceback__)
+            self.reloadFailed.emit(str(future.exception()))
+        else:
+            fp, engine, seconds = future.result()
+            self.loaded = fp
+            self.reloaded.emit(engine, seconds)
+
+        if self.pending:
+            self.pending = False
+            self.reload()
+
+    def shutdown(self):
+        self.timer.stop()
+        self.executor.shutdown(wait=False)
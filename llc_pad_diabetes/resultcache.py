@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ingest import expand_sources, is_pattern, is_streamed
+from snapshot import cache_dir, file_hash, fingerprint, is_fresh, read_meta
+
+RESULTS_FILE = "results.sqlite"
+# bumped whenever the metrics or their encoding change, so older entries miss
+RESULTS_FORMAT = 1
+BUSY_TIMEOUT_S = 10.0
+# interactive reads give up on a locked file almost at once and count a miss
+READ_TIMEOUT_S = 0.005
+MAX_ENTRIES = {"stats": 50000, "png": 1000}
+TOUCH_BATCH = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    dataset TEXT NOT NULL,
+    selection TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    used REAL NOT NULL,
+    UNIQUE (dataset, selection, kind)
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (kind, used);
+"""
+
+
+def default_path(source):
+    # next to the data, in the snapshot directory; glob patterns need an explicit path
+    return None if is_pattern(source) else os.path.join(cache_dir(source), RESULTS_FILE)
+
+
+def streamed_digest(source):
+    # extracts (which may be many large files) are identified by name, size
+    # and mtime, which is what every user of a shared drive sees
+    parts = [[os.path.basename(p), fingerprint(p)] for p in expand_sources(source)]
+
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def format_key(digest):
+    return None if digest is None else "{0}:{1}".format(RESULTS_FORMAT, digest)
+
+
+def dataset_key(source, hash_file=True):
+    # the key of the source as it is on disk now: the workbook's content hash,
+    # taken from a fresh snapshot when there is one. With hash_file=False,
+    # None is returned rather than reading the workbook. Loaded data carries
+    # its own key (StatsEngine.dataset_key), taken from the bytes it was read from.
+    if is_streamed(source):
+        return format_key(streamed_digest(source))
+
+    meta = read_meta(source)
+    if is_fresh(source, meta) and meta["source"].get("sha256"):
+        return format_key(meta["source"]["sha256"])
+
+    return format_key(file_hash(source)) if hash_file else None
+
+
+def selection_key(fields, selection):
+    # canonical: unticked groups left out, options sorted and de-duplicated
+    return json.dumps({field: sorted(set(values)) for field, values in zip(fields, selection) if values}, sort_keys=True)
+
+
+class ResultCache:
+    # computed resultsStats (and chart PNGs) in an SQLite file shared between
+    # sessions and users. The rollback journal is used rather than WAL, which
+    # needs shared memory that network file systems do not provide; readers
+    # wait up to BUSY_TIMEOUT_S for a writer. Any database error is a miss.
+    # Interactive callers write with the *_later methods, which queue the
+    # transaction on one writer thread instead of waiting for the drive.
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = dict(MAX_ENTRIES, **(max_entries or {}))
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.touched = {}
+        self.writer = None
+        self.hits = 0
+        self.misses = 0
+
+    def connection(self, timeout=BUSY_TIMEOUT_S):
+        # one connection per thread: the GUI worker, the HTTP renderer and the
+        # precompute command each get their own
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=timeout)
+            conn.execute("PRAGMA busy_timeout={0}".format(int(timeout * 1000)))
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+            self.local.timeout = timeout
+        elif self.local.timeout != timeout:
+            conn.execute("PRAGMA busy_timeout={0}".format(int(timeout * 1000)))
+            self.local.timeout = timeout
+
+        return conn
+
+    def get(self, dataset, selection, kind="stats", timeout=BUSY_TIMEOUT_S):
+        try:
+            row = self.connection(timeout).execute(
+                "SELECT value FROM results WHERE dataset = ? AND selection = ? AND kind = ?", (dataset, selection, kind)
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # last-use times are written in batches, on the writer thread, so a
+        # hit stays a pure read
+        with self.lock:
+            self.touched[(dataset, selection, kind)] = time.time()
+            flush = len(self.touched) >= TOUCH_BATCH
+        if flush:
+            self.later(self.flush)
+        return row[0]
+
+    def put_many(self, kind, items):
+        # items: (dataset, selection, value); one transaction for the lot
+        now = time.time()
+        try:
+            conn = self.connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO results (dataset, selection, kind, value, used) VALUES (?, ?, ?, ?, ?)",
+                    [(dataset, selection, kind, value, now) for dataset, selection, value in items]
+                )
+                self.evict(conn, kind)
+        except sqlite3.Error:
+            return False
+
+        return True
+
+    def put(self, dataset, selection, value, kind="stats"):
+        return self.put_many(kind, [(dataset, selection, value)])
+
+    def later(self, fn, *args):
+        with self.lock:
+            if self.writer is None:
+                self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="results-writer")
+            writer = self.writer
+
+        return writer.submit(fn, *args)
+
+    def put_later(self, dataset, selection, value, kind="stats"):
+        return self.later(self.put, dataset, selection, value, kind)
+
+    def evict(self, conn, kind):
+        count = conn.execute("SELECT COUNT(*) FROM results WHERE kind = ?", (kind,)).fetchone()[0]
+        excess = count - self.max_entries[kind]
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results WHERE kind = ? ORDER BY used LIMIT ?)",
+                (kind, excess)
+            )
+
+    def flush(self):
+        with self.lock:
+            touched, self.touched = self.touched, {}
+        if not touched:
+            return
+        try:
+            conn = self.connection()
+            with conn:
+                conn.executemany(
+                    "UPDATE results SET used = ? WHERE dataset = ? AND selection = ? AND kind = ?",
+                    [(used,) + key for key, used in touched.items()]
+                )
+        except sqlite3.Error:
+            pass
+
+    def get_stats(self, dataset, fields, selection, timeout=BUSY_TIMEOUT_S):
+        value = self.get(dataset, selection_key(fields, selection), timeout=timeout)
+        return None if value is None else json.loads(value)
+
+    def put_stats(self, dataset, fields, selection, stats):
+        return self.put(dataset, selection_key(fields, selection), json.dumps(stats))
+
+    def put_stats_later(self, dataset, fields, selection, stats):
+        return self.put_later(dataset, selection_key(fields, selection), json.dumps(stats))
+
+    def close(self):
+        # queued writes are finished first, and the writer's connection closed
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.submit(self.close_connection)
+            writer.shutdown(wait=True)
+        self.flush()
+        self.close_connection()
+
+    def close_connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+def precompute(engine, cache, selections, chunk_size=4096, progress=None):
+    # warms the cache for engine.dataset_key, one stats_many pass and one
+    # transaction per chunk of selections
+    from batch import chunked
+
+    selections = list(selections)
+    done = 0
+    for chunk in chunked(selections, chunk_size):
+        items = [
+            (engine.dataset_key, selection_key(engine.fields, selection), json.dumps(stats))
+            for selection, stats in zip(chunk, engine.compute_cohorts(chunk))
+        ]
+        cache.put_many("stats", items)
+        done += len(chunk)
+        if progress is not None:
+            progress(done, done / len(selections))
+
+    cache.close()
+    return done
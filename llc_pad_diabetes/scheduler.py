@@ -0,0 +1,88 @@
+import traceback
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from worker import AggregationWorker
+
+COALESCE_MS = 30
+
+
+class RecomputeScheduler(QObject):
+    # merges bursts of selection changes into one recompute and one redraw;
+    # the recompute runs on an AggregationWorker thread and its result comes
+    # back through a queued signal
+
+    resultsReady = pyqtSignal(int, object)
+    busyChanged = pyqtSignal(bool)
+    workerFinished = pyqtSignal(object)
+
+    def __init__(self, model, compute, interval=COALESCE_MS, parent=None):
+        super(RecomputeScheduler, self).__init__(parent)
+        self.model = model
+        self.worker = AggregationWorker(compute)
+        self.inFlight = False
+        self.pending = False
+        self.requested = 0
+        self.merged = 0
+        self.dropped = 0
+        self.computed = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.run)
+        self.workerFinished.connect(self.deliver)
+        model.subscribe(self.request)
+
+    def request(self, version=None):
+        self.requested += 1
+        if self.timer.isActive():
+            self.merged += 1
+        self.timer.start()
+
+    def run(self):
+        if self.inFlight:
+            # one recompute at a time; the latest selection goes next
+            if self.pending:
+                self.merged += 1
+            self.pending = True
+            return
+
+        self.inFlight = True
+        self.busyChanged.emit(True)
+        version, selection = self.model.snapshot()
+        future = self.worker.submit(version, selection)
+        # emitted from the worker thread, delivered on the GUI thread
+        future.add_done_callback(self.workerFinished.emit)
+
+    def deliver(self, future):
+        self.inFlight = False
+        if self.pending:
+            self.pending = False
+            self.run()
+        else:
+            self.busyChanged.emit(False)
+
+        if future.exception() is not None:
+            traceback.print_exception(type(future.exception()), future.exception(), future.exception().__traceback__)
+            self.dropped += 1
+            return
+
+        version, stats = future.result()
+        if version != self.model.version:
+            self.dropped += 1
+            return
+
+        self.computed += 1
+        self.resultsReady.emit(version, stats)
+
+    def counters(self):
+        return {
+            'requested': self.requested,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'computed': self.computed,
+            'skipped': self.merged + self.dropped
+        }
+
+    def shutdown(self):
+        self.timer.stop()
+        self.worker.shutdown(wait=False)
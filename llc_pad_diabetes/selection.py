@@ -0,0 +1,41 @@
+from core import SELECTION_FIELDS
+
+
+class SelectionModel:
+    # the current checkbox selection; version increases on every change so
+    # results computed for an older selection can be recognised and dropped
+
+    def __init__(self, fields=SELECTION_FIELDS):
+        self.fields = list(fields)
+        self.selected = {field: [] for field in self.fields}
+        self.version = 0
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def set(self, field, value, checked):
+        values = self.selected[field]
+        if bool(checked) == (value in values):
+            return False
+
+        if checked:
+            values.append(value)
+        else:
+            values.remove(value)
+        self.notify()
+
+        return True
+
+    def refresh(self):
+        # the selection is unchanged but the data behind it is not (a reload);
+        # results already in flight for the old data are dropped like stale ones
+        self.notify()
+
+    def notify(self):
+        self.version += 1
+        for listener in self.listeners:
+            listener(self.version)
+
+    def snapshot(self):
+        return self.version, tuple(tuple(self.selected[field]) for field in self.fields)
@@ -0,0 +1,236 @@
+import asyncio
+import io
+import json
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+from core import SELECTION_FIELDS
+from resultcache import READ_TIMEOUT_S, selection_key
+
+CACHE_SIZE = 8192
+# a chart PNG is ~100 KB against well under 1 KB of JSON, so charts get their
+# own cache, bounded by count and by total size
+CHART_CACHE_SIZE = 256
+CHART_CACHE_BYTES = 32 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=CACHE_SIZE, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        old = self.entries.get(key)
+        if old is not None:
+            self.nbytes -= len(old)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.nbytes += len(value)
+        while len(self.entries) > self.maxsize or (self.max_bytes is not None and self.nbytes > self.max_bytes and len(self.entries) > 1):
+            self.nbytes -= len(self.entries.popitem(last=False)[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def parse_selection(query, fields=SELECTION_FIELDS):
+    # repeated parameters (llc=a&llc=b) select several options of a group;
+    # order and duplicates do not matter, so the sorted tuple is the cache key
+    params = parse_qs(query, keep_blank_values=False)
+    unknown = set(params) - set(fields)
+    if unknown:
+        raise ValueError("unknown parameter(s): {0}".format(", ".join(sorted(unknown))))
+
+    return tuple(tuple(sorted(set(params.get(field, [])))) for field in fields)
+
+
+def response(status, content_type, body, keep_alive=True):
+    head = "HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\nConnection: {4}\r\n\r\n".format(
+        status, REASONS[status], content_type, len(body), "keep-alive" if keep_alive else "close"
+    )
+    return head.encode("latin-1") + body
+
+
+def error_body(message):
+    return json.dumps({"error": message}).encode()
+
+
+class StatsService:
+    # answers /stats (JSON) and /chart.png for a selection from an engine loaded
+    # once; encoded bodies are cached by canonical selection, so repeated
+    # queries skip both the aggregation and the encoding
+
+    def __init__(self, engine, cache_size=CACHE_SIZE, results=None):
+        self.engine = engine
+        self.cache = LRUCache(cache_size)
+        self.charts = LRUCache(CHART_CACHE_SIZE, CHART_CACHE_BYTES)
+        # optional persistent ResultCache behind the in-memory one
+        self.results = results
+        # matplotlib is not thread safe: charts are drawn on one thread that
+        # owns the renderer, away from the event loop
+        self.render_pool = ThreadPoolExecutor(max_workers=1)
+        self.renderer = None
+
+    def stats_body(self, selection):
+        key = ("stats", selection)
+        body = self.cache.get(key)
+        if body is None:
+            # only valid selections are cached; unknown labels are a 400
+            # rather than a row of zeros
+            self.engine.validate(selection)
+            # the loaded cube answers faster than a read of the shared cache,
+            # so stats are only written there (on the cache's writer thread)
+            body = json.dumps(self.engine.compute_stats(*selection)).encode()
+            self.store("stats", selection, body.decode())
+            self.cache.put(key, body)
+
+        return body
+
+    def stored(self, kind, selection):
+        if self.results is None or self.engine.dataset_key is None:
+            return None
+
+        # a locked file is a miss rather than a wait that holds up every chart
+        return self.results.get(self.engine.dataset_key, selection_key(self.engine.fields, selection), kind, READ_TIMEOUT_S)
+
+    def store(self, kind, selection, value):
+        if self.results is not None and self.engine.dataset_key is not None:
+            self.results.put_later(self.engine.dataset_key, selection_key(self.engine.fields, selection), value, kind)
+
+    def render_png(self, selection):
+        from export import ChartRenderer, selection_caption
+
+        stored = self.stored("png", selection)
+        if stored is not None:
+            return bytes(stored)
+
+        if self.renderer is None:
+            self.renderer = ChartRenderer()
+        buffer = io.BytesIO()
+        self.renderer.save(selection_caption(selection, self.engine.schema), self.engine.compute_stats(*selection), buffer)
+        self.store("png", selection, sqlite3.Binary(buffer.getvalue()))
+        return buffer.getvalue()
+
+    async def chart_body(self, selection):
+        key = ("chart", selection)
+        body = self.charts.get(key)
+        if body is None:
+            self.engine.validate(selection)
+            body = await asyncio.get_running_loop().run_in_executor(self.render_pool, self.render_png, selection)
+            self.charts.put(key, body)
+
+        return body
+
+    def health_body(self):
+        health = {
+            "cached": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses,
+            "charts_cached": len(self.charts), "charts_bytes": self.charts.nbytes,
+            "chart_hits": self.charts.hits, "chart_misses": self.charts.misses
+        }
+        if self.results is not None:
+            health["stored_hits"] = self.results.hits
+            health["stored_misses"] = self.results.misses
+
+        return json.dumps(health).encode()
+
+    async def dispatch(self, method, target):
+        if method != "GET":
+            return 405, "application/json", error_body("only GET is supported")
+
+        url = urlsplit(target)
+        try:
+            if url.path == "/stats":
+                return 200, "application/json", self.stats_body(parse_selection(url.query, self.engine.fields))
+            if url.path == "/chart.png":
+                return 200, "image/png", await self.chart_body(parse_selection(url.query, self.engine.fields))
+        except ValueError as e:
+            return 400, "application/json", error_body(str(e))
+        if url.path == "/health":
+            return 200, "application/json", self.health_body()
+
+        return 404, "application/json", error_body("no such endpoint: " + url.path)
+
+    async def handle(self, reader, writer):
+        # minimal HTTP/1.1 with keep-alive; requests on a connection are
+        # answered in order
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                parts = line.decode("latin-1").split()
+                if len(parts) != 3:
+                    writer.write(response(400, "application/json", error_body("malformed request line"), False))
+                    break
+                method, target, version = parts
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                keep_alive = headers.get("connection") != "close" if version == "HTTP/1.1" else headers.get("connection") == "keep-alive"
+                try:
+                    status, content_type, body = await self.dispatch(method, target)
+                except Exception as e:
+                    status, content_type, body = 500, "application/json", error_body(repr(e))
+                writer.write(response(status, content_type, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8000):
+        return await asyncio.start_server(self.handle, host, port)
+
+    def shutdown(self):
+        self.render_pool.shutdown()
+        if self.results is not None:
+            self.results.close()
+
+
+def serve(engine, host="127.0.0.1", port=8000, cache_size=CACHE_SIZE, results=None):
+    service = StatsService(engine, cache_size, results)
+
+    async def main():
+        server = await service.start(host, port)
+        print("serving on http://{0}:{1}".format(host, server.sockets[0].getsockname()[1]), flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
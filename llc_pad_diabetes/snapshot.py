@@ -0,0 +1,190 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from dataset import Dataset
+
+SHEET_NAME = "srcdata"
+CACHE_SUFFIX = ".cache"
+CACHE_FORMAT = 2
+
+
+def cache_dir(path):
+    return path + CACHE_SUFFIX
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def fingerprint(path, content_hash=False):
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if content_hash:
+        fp["sha256"] = file_hash(path)
+
+    return fp
+
+
+def read_source(path):
+    import pandas as pd
+
+    return pd.read_excel(path, sheet_name=SHEET_NAME)
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(cache_dir(path), "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return meta if meta.get("format") == CACHE_FORMAT else None
+
+
+def is_fresh(path, meta, check="stat"):
+    if meta is None:
+        return False
+    current = fingerprint(path, content_hash=(check == "hash"))
+    source = meta["source"]
+    if check == "hash":
+        return source.get("sha256") == current["sha256"]
+
+    return source["size"] == current["size"] and source["mtime_ns"] == current["mtime_ns"]
+
+
+def write_snapshot(dataset, path, fp=None):
+    # column files are tagged with a generation id and meta.json is swapped in last,
+    # so a reader never sees a half-written snapshot
+    if fp is None:
+        fp = fingerprint(path)
+    fp = dict(fp, sha256=fp.get("sha256") or file_hash(path))
+
+    directory = cache_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    generation = uuid.uuid4().hex[:12]
+
+    columns = []
+    for name in dataset.columns:
+        entry = {"name": name, "file": "{0}-{1}.npy".format(generation, len(columns))}
+        if dataset.is_categorical(name):
+            values = dataset.codes[name]
+            entry["categories"] = dataset.categories[name]
+        else:
+            values = dataset.values[name]
+        np.save(os.path.join(directory, entry["file"]), np.ascontiguousarray(values))
+        columns.append(entry)
+
+    meta = {"format": CACHE_FORMAT, "generation": generation, "rows": len(dataset), "source": fp, "columns": columns}
+    tmp = os.path.join(directory, "meta.{0}.tmp".format(generation))
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+
+    for name in os.listdir(directory):
+        if name.endswith(".npy") and not name.startswith(generation):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    return meta
+
+
+def load_snapshot(path, check="stat"):
+    meta = read_meta(path)
+    if not is_fresh(path, meta, check):
+        return None
+
+    directory = cache_dir(path)
+    codes, categories, values = {}, {}, {}
+    try:
+        for entry in meta["columns"]:
+            array = np.load(os.path.join(directory, entry["file"]), mmap_mode="r")
+            if "categories" in entry:
+                codes[entry["name"]] = array
+                categories[entry["name"]] = entry["categories"]
+            else:
+                values[entry["name"]] = array
+    except (OSError, ValueError):
+        return None
+
+    dataset = Dataset([entry["name"] for entry in meta["columns"]], codes, categories, values)
+    dataset.source_hash = meta["source"].get("sha256")
+
+    return dataset
+
+
+def read_categories(path):
+    # category labels of the last snapshot, read from meta.json alone so the GUI
+    # can lay out its options before any column is loaded. A stale snapshot's
+    # labels are returned too: they are provisional until the data is loaded
+    meta = read_meta(path)
+    if meta is None:
+        return {}
+
+    return {entry["name"]: entry["categories"] for entry in meta["columns"] if "categories" in entry}
+
+
+def load_source(path, rebuild=False, check="stat", background=True):
+    if not rebuild:
+        df = load_snapshot(path, check)
+        if df is not None:
+            return df
+
+    # the workbook is read into memory once and hashed and parsed from those
+    # bytes, so the hash always describes the data, even if the file is
+    # replaced while it is being parsed
+    fp = fingerprint(path)
+    with open(path, "rb") as f:
+        content = f.read()
+    fp["sha256"] = hashlib.sha256(content).hexdigest()
+    dataset = Dataset.from_frame(read_source(io.BytesIO(content)))
+    dataset.source_hash = fp["sha256"]
+    del content
+    if background:
+        threading.Thread(target=write_snapshot, args=(dataset, path, fp), daemon=True).start()
+    else:
+        write_snapshot(dataset, path, fp)
+
+    return dataset
+
+
+def memory_report(path):
+    # memory held by the parsed DataFrame versus the compact Dataset, from
+    # tracemalloc (numpy and pandas allocations are traced) rather than the
+    # resident set size, which freed pages rarely leave. The readers are
+    # imported first so their modules are not counted
+    import gc
+    import tracemalloc
+    import pandas
+    import openpyxl
+
+    tracemalloc.start()
+    try:
+        df = read_source(path)
+        frame_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        traced_with_frame, parse_peak = tracemalloc.get_traced_memory()
+        dataset = Dataset.from_frame(df)
+        del df
+        gc.collect()
+        traced_with_dataset = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "rows": len(dataset),
+        "frame_bytes": frame_bytes,
+        "dataset_bytes": int(dataset.nbytes),
+        "parse_peak_bytes": parse_peak,
+        "traced_with_frame": traced_with_frame,
+        "traced_with_dataset": traced_with_dataset
+    }
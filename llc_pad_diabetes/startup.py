@@ -0,0 +1,28 @@
+import time
+
+# imported first by the entry point; times are relative to that import, so the
+# interpreter (or frozen bootloader) start-up itself is not included
+START = time.perf_counter()
+
+marks = []
+_callbacks = {}
+
+
+def mark(name):
+    # the first occurrence of each milestone is kept
+    if any(name == seen for seen, _ in marks):
+        return
+    marks.append((name, time.perf_counter() - START))
+    for callback in _callbacks.pop(name, []):
+        callback()
+
+
+def when(name, callback):
+    _callbacks.setdefault(name, []).append(callback)
+
+
+def report():
+    lines = ["{0:<16} {1:>9}".format("milestone", "ms")]
+    lines.extend("{0:<16} {1:>9.1f}".format(name, seconds * 1000) for name, seconds in marks)
+
+    return "\n".join(lines)
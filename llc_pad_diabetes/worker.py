@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AggregationWorker:
+    # runs compute(*selection) off the calling thread; every result comes back
+    # tagged with the selection version it was computed for
+
+    def __init__(self, compute, max_workers=1):
+        self.compute = compute
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aggregation")
+
+    def run(self, version, selection):
+        return version, self.compute(*selection)
+
+    def submit(self, version, selection, callback=None):
+        future = self.executor.submit(self.run, version, selection)
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(*f.result()))
+
+        return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)